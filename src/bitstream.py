@@ -25,6 +25,10 @@ import numpy as np
 MAGIC_NUMBER = b'MEDC'
 VERSION = 0x01
 
+# Precompiled big-endian field formats
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+
 
 def pack_bitstream(width, height, bit_depth, block_size, quality, 
                    quant_matrix, huffman_table, encoded_data, num_bits):
@@ -49,25 +53,24 @@ def pack_bitstream(width, height, bit_depth, block_size, quality,
     # Header
     data.extend(MAGIC_NUMBER)
     data.append(VERSION)
-    data.extend(struct.pack('>H', width))   # Big-endian uint16
-    data.extend(struct.pack('>H', height))
+    data.extend(_U16.pack(width))   # Big-endian uint16
+    data.extend(_U16.pack(height))
     data.append(bit_depth)
     data.append(block_size)
     data.append(quality)
     
     # Quantization matrix
-    quant_flat = quant_matrix.flatten()
-    data.extend(struct.pack('>H', len(quant_flat)))
-    for val in quant_flat:
-        data.extend(struct.pack('>H', int(val)))
+    quant_bytes = np.ascontiguousarray(quant_matrix, dtype='>u2').tobytes()
+    data.extend(_U16.pack(len(quant_bytes) // 2))
+    data.extend(quant_bytes)
     
     # Huffman table
-    data.extend(struct.pack('>H', len(huffman_table)))
+    data.extend(_U16.pack(len(huffman_table)))
     data.extend(huffman_table)
     
     # Encoded data
-    data.extend(struct.pack('>I', num_bits))  # uint32
-    data.extend(struct.pack('>I', len(encoded_data)))
+    data.extend(_U32.pack(num_bits))  # uint32
+    data.extend(_U32.pack(len(encoded_data)))
     data.extend(encoded_data)
     
     return bytes(data)
@@ -78,7 +81,7 @@ def unpack_bitstream(data):
     Unpack bitstream and extract all components
     
     Args:
-        data: bytes
+        data: bytes-like object (bytes, memoryview, mmap)
         
     Returns:
         dict with all parameters and encoded data
@@ -86,7 +89,7 @@ def unpack_bitstream(data):
     offset = 0
     
     # Check magic number
-    magic = data[offset:offset+4]
+    magic = bytes(data[offset:offset+4])
     if magic != MAGIC_NUMBER:
         raise ValueError(f"Invalid magic number: {magic}")
     offset += 4
@@ -98,9 +101,9 @@ def unpack_bitstream(data):
     offset += 1
     
     # Image parameters
-    width = struct.unpack('>H', data[offset:offset+2])[0]
+    width = _U16.unpack_from(data, offset)[0]
     offset += 2
-    height = struct.unpack('>H', data[offset:offset+2])[0]
+    height = _U16.unpack_from(data, offset)[0]
     offset += 2
     bit_depth = data[offset]
     offset += 1
@@ -110,27 +113,35 @@ def unpack_bitstream(data):
     offset += 1
     
     # Quantization matrix
-    quant_size = struct.unpack('>H', data[offset:offset+2])[0]
+    quant_size = _U16.unpack_from(data, offset)[0]
     offset += 2
-    quant_flat = []
-    for _ in range(quant_size):
-        val = struct.unpack('>H', data[offset:offset+2])[0]
-        quant_flat.append(val)
-        offset += 2
-    quant_matrix = np.array(quant_flat, dtype=np.uint16).reshape(block_size, block_size)
+    quant_flat = np.frombuffer(data, dtype='>u2', count=quant_size, offset=offset)
+    quant_matrix = quant_flat.astype(np.uint16).reshape(block_size, block_size)
+    offset += quant_size * 2
     
     # Huffman table
-    huffman_size = struct.unpack('>H', data[offset:offset+2])[0]
+    huffman_size = _U16.unpack_from(data, offset)[0]
     offset += 2
     huffman_table = data[offset:offset+huffman_size]
+    if len(huffman_table) != huffman_size:
+        raise ValueError(f"Truncated Huffman table: expected {huffman_size} bytes, "
+                         f"got {len(huffman_table)}")
     offset += huffman_size
     
     # Encoded data
-    num_bits = struct.unpack('>I', data[offset:offset+4])[0]
+    num_bits = _U32.unpack_from(data, offset)[0]
     offset += 4
-    encoded_size = struct.unpack('>I', data[offset:offset+4])[0]
+    encoded_size = _U32.unpack_from(data, offset)[0]
     offset += 4
     encoded_data = data[offset:offset+encoded_size]
+    # The Huffman kernel reads past the end as zero bits, so a short
+    # payload must be rejected here
+    if len(encoded_data) != encoded_size:
+        raise ValueError(f"Truncated encoded data: expected {encoded_size} bytes, "
+                         f"got {len(encoded_data)}")
+    if num_bits > 8 * encoded_size:
+        raise ValueError(f"Bit count {num_bits} exceeds encoded data size "
+                         f"({encoded_size} bytes)")
     offset += encoded_size
     
     return {
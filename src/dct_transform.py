@@ -1,36 +1,87 @@
 """
 DCT transform and quantization for image compression
+
+The codec (encode.py, decode.py, tools/evaluate_real_data.py) uses
+encode_blocks / decode_blocks. dct2d / idct2d, quantize / dequantize,
+block_dct_encode / block_dct_decode and zigzag_flatten / zigzag_unflatten
+are the step-by-step reference implementation of the same pipeline and
+are not called at runtime.
 """
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-from scipy.fftpack import dct, idct
+
+
+# Minimum number of block rows per thread in encode_blocks/decode_blocks
+MIN_BAND_ROWS = 64
+
+# Orthonormal DCT-II basis matrices, keyed by (transform size, dtype)
+_DCT_MATRICES = {}
+
+
+def dct_matrix(size=8, dtype=np.float64):
+    """
+    Orthonormal DCT-II basis matrix (cached per size and dtype)
+    
+    Args:
+        size: Transform size N
+        dtype: Floating point type of the matrix
+        
+    Returns:
+        N x N matrix C with C[k, n] = sqrt(2/N) * cos(pi * (2n + 1) * k / (2N)),
+        first row scaled by 1/sqrt(2), so that dct(x) = C @ x
+    """
+    key = (size, np.dtype(dtype))
+    if key not in _DCT_MATRICES:
+        n = np.arange(size)
+        matrix = np.sqrt(2.0 / size) * np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+        matrix[0] /= np.sqrt(2.0)
+        matrix = matrix.astype(dtype)
+        matrix.setflags(write=False)
+        _DCT_MATRICES[key] = matrix
+    return _DCT_MATRICES[key]
 
 
 def dct2d(block):
     """
     2D DCT transform on a block
     
+    Computed in float32, which is ample for 16-bit samples that are
+    quantized to int16 afterwards.
+    
     Args:
-        block: 2D numpy array (typically 8x8)
+        block: 2D numpy array (typically 8x8), or a stack of blocks
+               along the leading axes
         
     Returns:
-        DCT coefficients
+        DCT coefficients (float32)
     """
-    return dct(dct(block.T, norm='ortho').T, norm='ortho')
+    block = np.asarray(block, dtype=np.float32)
+    rows = dct_matrix(block.shape[-2], np.float32)
+    cols = dct_matrix(block.shape[-1], np.float32)
+    return rows @ block @ cols.T
 
 
-def idct2d(block):
+def idct2d(block, out=None):
     """
     2D inverse DCT transform
     
     Args:
-        block: DCT coefficients
+        block: DCT coefficients (single block or stack of blocks)
+        out: Optional float32 array (may be a strided view) to write into
         
     Returns:
-        Reconstructed spatial block
+        Reconstructed spatial block (float32)
     """
-    return idct(idct(block.T, norm='ortho').T, norm='ortho')
+    block = np.asarray(block, dtype=np.float32)
+    rows = dct_matrix(block.shape[-2], np.float32)
+    cols = dct_matrix(block.shape[-1], np.float32)
+    return np.matmul(rows.T @ block, cols, out=out)
 
 
+@functools.lru_cache(maxsize=None)
 def create_quantization_matrix(quality, block_size=8, bit_depth=16):
     """
     Create quantization matrix based on quality parameter
@@ -41,7 +92,7 @@ def create_quantization_matrix(quality, block_size=8, bit_depth=16):
         bit_depth: Bit depth of input image
         
     Returns:
-        Quantization matrix
+        Quantization matrix (read-only, cached per argument set)
     """
     # Base quantization matrix (similar to JPEG but scaled for higher bit depth)
     base_matrix = np.array([
@@ -68,7 +119,9 @@ def create_quantization_matrix(quality, block_size=8, bit_depth=16):
     quant_matrix = np.floor((base_matrix * scale * bit_scale + 50) / 100)
     quant_matrix = np.clip(quant_matrix, 1, 65535)
     
-    return quant_matrix.astype(np.uint16)
+    quant_matrix = quant_matrix.astype(np.uint16)
+    quant_matrix.setflags(write=False)
+    return quant_matrix
 
 
 def quantize(coeffs, quant_matrix):
@@ -99,45 +152,71 @@ def dequantize(quantized_coeffs, quant_matrix):
     return quantized_coeffs * quant_matrix
 
 
+def _for_each_band(func, num_block_rows):
+    """
+    Call func(start, stop) over bands of block rows
+    
+    Large images are split into one band per CPU and run on a thread pool;
+    NumPy releases the GIL inside matmul, so bands transform in parallel.
+    Small images run as a single band on the calling thread.
+    """
+    workers = min(os.cpu_count() or 1, num_block_rows // MIN_BAND_ROWS)
+    if workers <= 1:
+        func(0, num_block_rows)
+        return
+    
+    bounds = np.linspace(0, num_block_rows, workers + 1).astype(int)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(func, bounds[:-1], bounds[1:]))
+
+
 def block_dct_encode(image, quant_matrix, block_size=8):
     """
     Apply block DCT encoding to entire image
     
+    Reference implementation (separable DCT, natural coefficient order);
+    the codec uses encode_blocks.
+    
     Args:
         image: Input image (must be padded to block_size)
         quant_matrix: Quantization matrix
         block_size: Size of blocks
         
     Returns:
-        Quantized DCT coefficients for all blocks
+        Quantized DCT coefficients for all blocks,
+        array of shape (num_blocks, block_size, block_size) in raster order
     """
     height, width = image.shape
     
-    # Initialize output
-    dct_blocks = []
+    # View image as a (block_rows, block_cols, block_size, block_size) grid (no copy)
+    blocks = image.reshape(height // block_size, block_size,
+                           width // block_size, block_size).swapaxes(1, 2)
+    quant_blocks = np.empty(blocks.shape, dtype=np.int16)
     
-    # Process each block
-    for i in range(0, height, block_size):
-        for j in range(0, width, block_size):
-            block = image[i:i+block_size, j:j+block_size].astype(np.float64)
-            
-            # Apply DCT
-            dct_block = dct2d(block)
-            
-            # Quantize
-            quant_block = quantize(dct_block, quant_matrix)
-            
-            dct_blocks.append(quant_block)
+    def encode_band(start, stop):
+        # Apply DCT to every block in the band (batched C @ block @ C.T)
+        coeffs = dct2d(blocks[start:stop])
+        
+        # Quantize in place, then store as int16
+        np.divide(coeffs, quant_matrix, out=coeffs)
+        np.rint(coeffs, out=coeffs)
+        quant_blocks[start:stop] = coeffs
+    
+    _for_each_band(encode_band, blocks.shape[0])
     
-    return dct_blocks
+    return quant_blocks.reshape(-1, block_size, block_size)
 
 
 def block_dct_decode(dct_blocks, quant_matrix, height, width, block_size=8):
     """
     Decode image from quantized DCT blocks
     
+    Reference implementation, inverse of block_dct_encode; the codec
+    uses decode_blocks.
+    
     Args:
-        dct_blocks: List of quantized DCT blocks
+        dct_blocks: Quantized DCT blocks in raster order
+                    (list or array of shape (num_blocks, block_size, block_size))
         quant_matrix: Quantization matrix
         height, width: Output image dimensions
         block_size: Size of blocks
@@ -145,22 +224,23 @@ def block_dct_decode(dct_blocks, quant_matrix, height, width, block_size=8):
     Returns:
         Reconstructed image
     """
-    # Initialize output
-    reconstructed = np.zeros((height, width), dtype=np.float64)
-    
-    block_idx = 0
-    for i in range(0, height, block_size):
-        for j in range(0, width, block_size):
-            # Dequantize
-            dct_block = dequantize(dct_blocks[block_idx], quant_matrix)
-            
-            # Apply inverse DCT
-            spatial_block = idct2d(dct_block)
-            
-            # Place in output
-            reconstructed[i:i+block_size, j:j+block_size] = spatial_block
-            
-            block_idx += 1
+    blocks_h = height // block_size
+    blocks_w = width // block_size
+    dct_blocks = np.asarray(dct_blocks).reshape(blocks_h, blocks_w, block_size, block_size)
+    
+    # Inverse DCT writes each block straight into its place through a
+    # (block_rows, block_cols, N, N) view of the output
+    reconstructed = np.empty((height, width), dtype=np.float32)
+    block_view = reconstructed.reshape(blocks_h, block_size, blocks_w, block_size).swapaxes(1, 2)
+    
+    def decode_band(start, stop):
+        # Dequantize
+        coeffs = dequantize(dct_blocks[start:stop], quant_matrix).astype(np.float32)
+        
+        # Apply inverse DCT to every block in the band
+        idct2d(coeffs, out=block_view[start:stop])
+    
+    _for_each_band(decode_band, blocks_h)
     
     return reconstructed
 
@@ -188,16 +268,136 @@ def zigzag_order(block_size=8):
     return zigzag
 
 
+def _build_zigzag_index(block_size):
+    """Flat (row-major) indices of a block in zigzag order"""
+    index = np.array([i * block_size + j for i, j in zigzag_order(block_size)], dtype=np.intp)
+    index.setflags(write=False)
+    return index
+
+
+# Zigzag indices for the common block sizes, built once at import
+_ZIGZAG_INDEX = {n: _build_zigzag_index(n) for n in (4, 8, 16)}
+
+
+def zigzag_index(block_size=8):
+    """
+    Flat (row-major) indices of a block in zigzag order
+    
+    Args:
+        block_size: Block size
+    
+    Returns:
+        Read-only integer array of length block_size**2
+    """
+    index = _ZIGZAG_INDEX.get(block_size)
+    if index is None:
+        index = _ZIGZAG_INDEX[block_size] = _build_zigzag_index(block_size)
+    return index
+
+
 def zigzag_flatten(block):
-    """Flatten block in zigzag order"""
-    order = zigzag_order(block.shape[0])
-    return np.array([block[i, j] for i, j in order])
+    """Flatten block (or stack of blocks) in zigzag order"""
+    block_size = block.shape[-1]
+    flat = block.reshape(block.shape[:-2] + (block_size * block_size,))
+    return flat[..., zigzag_index(block_size)]
 
 
 def zigzag_unflatten(flattened, block_size=8):
-    """Reconstruct block from zigzag-ordered array"""
-    block = np.zeros((block_size, block_size), dtype=flattened.dtype)
-    order = zigzag_order(block_size)
-    for idx, (i, j) in enumerate(order):
-        block[i, j] = flattened[idx]
-    return block
+    """Reconstruct block (or stack of blocks) from zigzag-ordered array"""
+    flattened = np.asarray(flattened)
+    block = np.empty_like(flattened)
+    block[..., zigzag_index(block_size)] = flattened
+    return block.reshape(flattened.shape[:-1] + (block_size, block_size))
+
+
+_ZIGZAG_DCT_MATRICES = {}
+
+
+def zigzag_dct_matrix(block_size=8):
+    """
+    2D DCT of a flattened block as one matrix, rows in zigzag order
+    
+    Returns:
+        (N*N) x (N*N) float32 matrix K with K @ block.ravel() equal to
+        zigzag_flatten(dct2d(block))
+    """
+    if block_size not in _ZIGZAG_DCT_MATRICES:
+        basis = dct_matrix(block_size, np.float64)
+        matrix = np.kron(basis, basis)[zigzag_index(block_size)].astype(np.float32)
+        matrix.setflags(write=False)
+        _ZIGZAG_DCT_MATRICES[block_size] = matrix
+    return _ZIGZAG_DCT_MATRICES[block_size]
+
+
+def encode_blocks(image, quant_matrix, block_size=8):
+    """
+    DCT, quantize and zigzag-scan every block of an image
+    
+    Each block is transformed by a single product with zigzag_dct_matrix,
+    so the whole image is one (num_blocks x N*N) @ (N*N x N*N) matmul and
+    the coefficients come out already in zigzag order.
+    
+    Args:
+        image: Input image (must be padded to block_size)
+        quant_matrix: Quantization matrix
+        block_size: Size of blocks
+        
+    Returns:
+        int16 array of shape (num_blocks, block_size**2), blocks in raster
+        order, coefficients in zigzag order
+    """
+    height, width = image.shape
+    blocks_h = height // block_size
+    blocks_w = width // block_size
+    block_len = block_size * block_size
+    
+    blocks = image.reshape(blocks_h, block_size, blocks_w, block_size).swapaxes(1, 2)
+    transform_t = zigzag_dct_matrix(block_size).T
+    quant = quant_matrix.reshape(-1)[zigzag_index(block_size)].astype(np.float32)
+    coeffs_out = np.empty((blocks_h, blocks_w, block_len), dtype=np.int16)
+    
+    def encode_band(start, stop):
+        flat = blocks[start:stop].astype(np.float32).reshape(-1, block_len)
+        coeffs = flat @ transform_t
+        np.divide(coeffs, quant, out=coeffs)
+        np.rint(coeffs, out=coeffs)
+        coeffs_out[start:stop] = coeffs.reshape(stop - start, blocks_w, block_len)
+    
+    _for_each_band(encode_band, blocks_h)
+    
+    return coeffs_out.reshape(-1, block_len)
+
+
+def decode_blocks(coeffs, quant_matrix, height, width, block_size=8):
+    """
+    Inverse of encode_blocks: dequantize, un-zigzag and inverse DCT
+    
+    Args:
+        coeffs: Zigzag-ordered quantized coefficients, array of shape
+                (num_blocks, block_size**2) (or flat) in raster block order
+        quant_matrix: Quantization matrix
+        height, width: Output (padded) image dimensions
+        block_size: Size of blocks
+        
+    Returns:
+        Reconstructed image (float32)
+    """
+    blocks_h = height // block_size
+    blocks_w = width // block_size
+    block_len = block_size * block_size
+    
+    coeffs = np.asarray(coeffs).reshape(blocks_h, blocks_w, block_len)
+    transform = zigzag_dct_matrix(block_size)
+    quant = quant_matrix.reshape(-1)[zigzag_index(block_size)].astype(np.float32)
+    
+    reconstructed = np.empty((height, width), dtype=np.float32)
+    block_view = reconstructed.reshape(blocks_h, block_size, blocks_w, block_size).swapaxes(1, 2)
+    
+    def decode_band(start, stop):
+        dequant = coeffs[start:stop].reshape(-1, block_len) * quant
+        pixels = dequant @ transform
+        block_view[start:stop] = pixels.reshape(stop - start, blocks_w, block_size, block_size)
+    
+    _for_each_band(decode_band, blocks_h)
+    
+    return reconstructed
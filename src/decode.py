@@ -7,12 +7,14 @@ Usage:
 """
 
 import argparse
+import mmap
+import os
 import numpy as np
 from pathlib import Path
 import sys
 
 from utils import save_raw_image, unpad_image
-from dct_transform import block_dct_decode, zigzag_unflatten
+from dct_transform import decode_blocks
 from huffman_coding import decode_coefficients
 from bitstream import unpack_bitstream
 
@@ -27,76 +29,81 @@ def decode_image(input_path, output_path):
     """
     print(f"Decoding {input_path}...")
     
-    # Read bitstream
+    # Read bitstream (memory-mapped: header fields, Huffman table and payload
+    # are parsed as zero-copy views instead of reading the file into memory)
     try:
-        with open(input_path, 'rb') as f:
-            bitstream_data = f.read()
-    except Exception as e:
+        f = open(input_path, 'rb')
+    except OSError as e:
         print(f"Error reading input file: {e}")
         sys.exit(1)
     
-    # Unpack bitstream
-    try:
-        params = unpack_bitstream(bitstream_data)
-    except Exception as e:
-        print(f"Error: Malformed bitstream - {e}")
-        sys.exit(1)
-    
-    # Extract parameters
-    width = params['width']
-    height = params['height']
-    bit_depth = params['bit_depth']
-    block_size = params['block_size']
-    quality = params['quality']
-    quant_matrix = params['quant_matrix']
-    huffman_table = params['huffman_table']
-    encoded_data = params['encoded_data']
-    num_bits = params['num_bits']
-    
-    print(f"Image size: {width}x{height}")
-    print(f"Bit depth: {bit_depth}")
-    print(f"Quality: {quality}")
-    print(f"Block size: {block_size}")
-    
-    # Calculate padded dimensions
-    padded_height = ((height + block_size - 1) // block_size) * block_size
-    padded_width = ((width + block_size - 1) // block_size) * block_size
-    num_blocks = (padded_height // block_size) * (padded_width // block_size)
-    num_coeffs = num_blocks * block_size * block_size
-    
-    print(f"Number of blocks: {num_blocks}")
-    
-    # Huffman decoding
-    print("Applying Huffman decoding...")
-    coeffs_flat = decode_coefficients(encoded_data, huffman_table, num_bits, num_coeffs)
-    
-    # Reshape into blocks
-    print("Reconstructing blocks...")
-    dct_blocks = []
-    for i in range(num_blocks):
-        start_idx = i * block_size * block_size
-        end_idx = start_idx + block_size * block_size
-        block_flat = coeffs_flat[start_idx:end_idx]
+    with f:
+        # mmap cannot map an empty file; report it like any other bad bitstream
+        if os.fstat(f.fileno()).st_size == 0:
+            print("Error: Malformed bitstream - empty file")
+            sys.exit(1)
         
-        # Convert to numpy array
-        block_flat_array = np.array(block_flat, dtype=np.int16)
-        
-        # Unflatten from zigzag order
-        block = zigzag_unflatten(block_flat_array, block_size)
-        dct_blocks.append(block)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as bitstream_data:
+            # Unpack bitstream
+            error = None
+            try:
+                params = unpack_bitstream(memoryview(bitstream_data))
+            except Exception as e:
+                error = e
+            if error is not None:
+                print(f"Error: Malformed bitstream - {error}")
+                del error  # drop the traceback (and its views into the mapping)
+                sys.exit(1)
+            
+            # Extract parameters
+            width = params['width']
+            height = params['height']
+            bit_depth = params['bit_depth']
+            block_size = params['block_size']
+            quality = params['quality']
+            quant_matrix = params['quant_matrix']
+            num_bits = params['num_bits']
+            
+            print(f"Image size: {width}x{height}")
+            print(f"Bit depth: {bit_depth}")
+            print(f"Quality: {quality}")
+            print(f"Block size: {block_size}")
+            
+            # Calculate padded dimensions
+            padded_height = ((height + block_size - 1) // block_size) * block_size
+            padded_width = ((width + block_size - 1) // block_size) * block_size
+            num_blocks = (padded_height // block_size) * (padded_width // block_size)
+            num_coeffs = num_blocks * block_size * block_size
+            
+            print(f"Number of blocks: {num_blocks}")
+            
+            # Huffman decoding
+            print("Applying Huffman decoding...")
+            coeffs_flat = decode_coefficients(params['encoded_data'], params['huffman_table'],
+                                              num_bits, num_coeffs)
+            
+            # The Huffman table and payload are views into the mapping; release
+            # them so it can be closed
+            del params
+    
+    if len(coeffs_flat) != num_coeffs:
+        print(f"Error: Malformed bitstream - expected {num_coeffs} coefficients, "
+              f"decoded {len(coeffs_flat)}")
+        sys.exit(1)
     
-    # Apply inverse DCT
+    # Apply inverse DCT (dequantize, un-zigzag and transform all blocks at once)
     print("Applying inverse DCT...")
-    reconstructed_padded = block_dct_decode(
-        dct_blocks, quant_matrix, padded_height, padded_width, block_size
+    reconstructed_padded = decode_blocks(
+        coeffs_flat, quant_matrix, padded_height, padded_width, block_size
     )
     
     # Remove padding
     reconstructed = unpad_image(reconstructed_padded, (height, width))
     
-    # Clip to valid range
+    # Clip to valid range (in place) and convert straight to the output type
     max_val = (1 << bit_depth) - 1
-    reconstructed = np.clip(reconstructed, 0, max_val).astype(np.int32)
+    np.clip(reconstructed, 0, max_val, out=reconstructed)
+    reconstructed = reconstructed.astype(np.uint16)
     
     # Save output
     print(f"Saving to {output_path}...")
@@ -12,55 +12,35 @@ from pathlib import Path
 import sys
 
 from utils import read_dicom, pad_image
-from dct_transform import (
-    create_quantization_matrix, block_dct_encode, zigzag_flatten
-)
+from dct_transform import create_quantization_matrix, encode_blocks
 from huffman_coding import encode_coefficients
 from bitstream import pack_bitstream
 
 
-def encode_image(input_path, output_path, quality=75, block_size=8):
+def encode_array(pixels, bit_depth, quality=75, block_size=8):
     """
-    Encode medical image to compressed format
+    Encode an in-memory image to a compressed bitstream
     
     Args:
-        input_path: Path to input DICOM file
-        output_path: Path to output compressed file
+        pixels: 2D numpy array of pixel values
+        bit_depth: Bits per pixel of the source image
         quality: Quality parameter (1-100, higher = better)
         block_size: DCT block size
+        
+    Returns:
+        bytes: Complete bitstream (same format encode_image writes)
     """
-    print(f"Encoding {input_path}...")
-    print(f"Quality: {quality}")
-    
-    # Read input image
-    try:
-        pixels, metadata = read_dicom(input_path)
-        print(f"Image size: {metadata['width']}x{metadata['height']}")
-        print(f"Bit depth: {metadata['bit_depth']}")
-        print(f"Modality: {metadata['modality']}")
-    except Exception as e:
-        print(f"Error reading input: {e}")
-        sys.exit(1)
-    
-    # Extract parameters
-    width = metadata['width']
-    height = metadata['height']
-    bit_depth = metadata['bit_depth']
+    height, width = pixels.shape
     
     # Pad image to block size
     padded_image, original_shape = pad_image(pixels, block_size)
-    padded_height, padded_width = padded_image.shape
     
     # Create quantization matrix
     quant_matrix = create_quantization_matrix(quality, block_size, bit_depth)
     
-    # Apply block DCT encoding
+    # Apply block DCT encoding (coefficients come out in zigzag order)
     print("Applying DCT transform...")
-    dct_blocks = block_dct_encode(padded_image, quant_matrix, block_size)
-    
-    # Flatten blocks in zigzag order
-    print("Flattening coefficients...")
-    coeffs_list = [zigzag_flatten(block) for block in dct_blocks]
+    coeffs_list = encode_blocks(padded_image, quant_matrix, block_size)
     
     # Huffman encoding
     print("Applying Huffman encoding...")
@@ -68,7 +48,7 @@ def encode_image(input_path, output_path, quality=75, block_size=8):
     
     # Pack into bitstream
     print("Packing bitstream...")
-    bitstream = pack_bitstream(
+    return pack_bitstream(
         width=width,
         height=height,
         bit_depth=bit_depth,
@@ -79,6 +59,36 @@ def encode_image(input_path, output_path, quality=75, block_size=8):
         encoded_data=encoded_data,
         num_bits=num_bits
     )
+
+
+def encode_image(input_path, output_path, quality=75, block_size=8):
+    """
+    Encode medical image to compressed format
+    
+    Args:
+        input_path: Path to input DICOM file
+        output_path: Path to output compressed file
+        quality: Quality parameter (1-100, higher = better)
+        block_size: DCT block size
+    """
+    print(f"Encoding {input_path}...")
+    print(f"Quality: {quality}")
+    
+    # Read input image
+    try:
+        pixels, metadata = read_dicom(input_path)
+        print(f"Image size: {metadata['width']}x{metadata['height']}")
+        print(f"Bit depth: {metadata['bit_depth']}")
+        print(f"Modality: {metadata['modality']}")
+    except Exception as e:
+        print(f"Error reading input: {e}")
+        sys.exit(1)
+    
+    # Extract parameters
+    width = metadata['width']
+    height = metadata['height']
+    
+    bitstream = encode_array(pixels, metadata['bit_depth'], quality, block_size)
     
     # Write to file
     with open(output_path, 'wb') as f:
@@ -1,20 +1,38 @@
 """
 Huffman entropy coding for DCT coefficients
 """
+import functools
 import numpy as np
-from collections import Counter, defaultdict
+from collections import defaultdict
 import heapq
 
+try:
+    from numba import njit
+except ImportError:  # Numba is optional; the kernels below then run as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
 
-class HuffmanNode:
-    def __init__(self, symbol=None, freq=0, left=None, right=None):
-        self.symbol = symbol
+
+# Number of bits resolved per decoder table lookup; longer codes fall back
+# to a tree walk
+LUT_BITS = 11
+
+
+class HuffmanTree:
+    """
+    Huffman tree stored as parallel arrays
+    
+    Node ids 0..len(symbols)-1 are the leaves (in the order of symbols);
+    internal nodes follow. left/right hold child ids, -1 for leaves.
+    """
+    def __init__(self, symbols, freq, left, right, root):
+        self.symbols = symbols
         self.freq = freq
         self.left = left
         self.right = right
-    
-    def __lt__(self, other):
-        return self.freq < other.freq
+        self.root = root
 
 
 def build_huffman_tree(symbols_freq):
@@ -25,97 +43,320 @@ def build_huffman_tree(symbols_freq):
         symbols_freq: Dict of {symbol: frequency}
         
     Returns:
-        Root node of Huffman tree
+        HuffmanTree
     """
     if not symbols_freq:
         return None
     
-    # Create leaf nodes
-    heap = [HuffmanNode(symbol=sym, freq=freq) for sym, freq in symbols_freq.items()]
+    # Leaves get ids 0..n-1, merged nodes n..2n-2
+    symbols = list(symbols_freq)
+    num_leaves = len(symbols)
+    num_nodes = 2 * num_leaves - 1
+    freq = [int(f) for f in symbols_freq.values()] + [0] * (num_nodes - num_leaves)
+    left = [-1] * num_nodes
+    right = [-1] * num_nodes
+    
+    # Heap of (frequency, node id) pairs
+    heap = [(f, node) for node, f in enumerate(freq[:num_leaves])]
     heapq.heapify(heap)
     
     # Build tree
+    next_node = num_leaves
     while len(heap) > 1:
-        left = heapq.heappop(heap)
-        right = heapq.heappop(heap)
+        left_freq, left_node = heapq.heappop(heap)
+        right_freq, right_node = heapq.heappop(heap)
         
-        parent = HuffmanNode(freq=left.freq + right.freq, left=left, right=right)
-        heapq.heappush(heap, parent)
+        freq[next_node] = left_freq + right_freq
+        left[next_node] = left_node
+        right[next_node] = right_node
+        heapq.heappush(heap, (freq[next_node], next_node))
+        next_node += 1
     
-    return heap[0]
+    return HuffmanTree(symbols, freq, left, right, heap[0][1])
 
 
-def generate_huffman_codes(root):
+def generate_huffman_codes(tree):
     """
-    Generate Huffman codes from tree
+    Generate canonical Huffman codes from tree
+    
+    Only the code lengths are taken from the tree; codes are then assigned
+    in (length, symbol) order so that each length uses consecutive values.
     
     Args:
-        root: Root of Huffman tree
+        tree: HuffmanTree
         
     Returns:
-        Dict of {symbol: code_string}
+        Dict of {symbol: (code, code_length)}
     """
-    if root is None:
+    if tree is None:
         return {}
     
-    codes = {}
-    
-    def traverse(node, code=''):
-        if node.symbol is not None:  # Leaf node
-            codes[node.symbol] = code if code else '0'
+    # Collect code lengths with an explicit stack instead of recursion
+    num_leaves = len(tree.symbols)
+    lengths = {}
+    stack = [(tree.root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        if node < num_leaves:  # Leaf node
+            lengths[tree.symbols[node]] = max(depth, 1)
         else:
-            if node.left:
-                traverse(node.left, code + '0')
-            if node.right:
-                traverse(node.right, code + '1')
+            stack.append((tree.left[node], depth + 1))
+            stack.append((tree.right[node], depth + 1))
+    
+    return canonical_codes(lengths)
+
+
+def canonical_codes(lengths):
+    """
+    Assign canonical Huffman codes from code lengths
+    
+    Args:
+        lengths: Dict of {symbol: code_length}
+        
+    Returns:
+        Dict of {symbol: (code, code_length)}
+    """
+    codes = {}
+    code = 0
+    prev_length = 0
+    for symbol, length in sorted(lengths.items(), key=lambda item: (item[1], item[0])):
+        code <<= length - prev_length
+        codes[symbol] = (code, length)
+        code += 1
+        prev_length = length
     
-    traverse(root)
     return codes
 
 
+def _code_tables(codes):
+    """
+    Build code lookup tables indexed by (symbol - min_symbol)
+    
+    Args:
+        codes: Dict of {symbol: (code, code_length)}
+        
+    Returns:
+        min_symbol, code_values (int64 array), code_lengths (int64 array)
+    """
+    symbols = [int(symbol) for symbol in codes]
+    min_symbol = min(symbols)
+    size = max(symbols) - min_symbol + 1
+    
+    code_values = np.zeros(size, dtype=np.int64)
+    code_lengths = np.zeros(size, dtype=np.int64)
+    for symbol, (code, length) in codes.items():
+        code_values[int(symbol) - min_symbol] = code
+        code_lengths[int(symbol) - min_symbol] = length
+    
+    return min_symbol, code_values, code_lengths
+
+
+@njit(cache=True)
+def _pack_symbols(indices, code_values, code_lengths, out):
+    """Write the code of every symbol index into out, MSB first"""
+    buffer = 0
+    buffered_bits = 0
+    pos = 0
+    for i in range(indices.shape[0]):
+        length = code_lengths[indices[i]]
+        buffer = (buffer << length) | code_values[indices[i]]
+        buffered_bits += length
+        while buffered_bits >= 8:
+            buffered_bits -= 8
+            out[pos] = (buffer >> buffered_bits) & 0xFF
+            pos += 1
+        buffer &= (1 << buffered_bits) - 1
+    
+    # Flush remaining bits, zero-padded on the right
+    if buffered_bits > 0:
+        out[pos] = (buffer << (8 - buffered_bits)) & 0xFF
+
+
 def encode_huffman(data, codes):
     """
     Encode data using Huffman codes
     
     Args:
         data: List/array of symbols
-        codes: Dict of {symbol: code_string}
+        codes: Dict of {symbol: (code, code_length)}
         
     Returns:
-        Encoded bitstring
+        encoded bytes (zero-padded to a whole byte), num_bits
     """
-    return ''.join(codes[symbol] for symbol in data)
+    if not codes:
+        return b'', 0
+    
+    min_symbol, code_values, code_lengths = _code_tables(codes)
+    indices = np.asarray(data, dtype=np.int64) - min_symbol
+    
+    # Exact output size is known up front; the kernel writes every byte
+    # (including the zero-padded tail), so no zero-fill is needed
+    num_bits = int(code_lengths[indices].sum())
+    out = np.empty((num_bits + 7) // 8, dtype=np.uint8)
+    _pack_symbols(indices, code_values, code_lengths, out)
+    
+    return out.tobytes(), num_bits
 
 
-def decode_huffman(bitstring, root):
+def _decode_tree(codes):
     """
-    Decode bitstring using Huffman tree
+    Flatten the code table into a binary tree stored as arrays
     
     Args:
-        bitstring: String of '0' and '1'
-        root: Root of Huffman tree
+        codes: Dict of {symbol: (code, code_length)}
         
     Returns:
-        List of decoded symbols
+        children (N x 2 int32 array, -1 = no child), symbols (int32 array)
     """
-    if root is None or root.symbol is not None:
-        # Single symbol tree
-        return [root.symbol] * len(bitstring) if root else []
-    
-    symbols = []
-    current = root
+    children = [[-1, -1]]
+    symbols = [0]
+    for symbol, (code, length) in codes.items():
+        node = 0
+        for shift in range(length - 1, -1, -1):
+            branch = (code >> shift) & 1
+            if children[node][branch] < 0:
+                children[node][branch] = len(children)
+                children.append([-1, -1])
+                symbols.append(0)
+            node = children[node][branch]
+        symbols[node] = int(symbol)
+    
+    return np.array(children, dtype=np.int32), np.array(symbols, dtype=np.int32)
+
+
+def _decode_lut(codes, lut_bits):
+    """
+    Build a lookup table over every lut_bits-bit prefix
     
-    for bit in bitstring:
-        if bit == '0':
-            current = current.left
+    Args:
+        codes: Dict of {symbol: (code, code_length)}
+        lut_bits: Number of bits peeked per lookup
+        
+    Returns:
+        lut_symbols (int32 array), lut_lengths (int64 array, 0 = code longer than lut_bits)
+    """
+    lut_symbols = np.zeros(1 << lut_bits, dtype=np.int32)
+    lut_lengths = np.zeros(1 << lut_bits, dtype=np.int64)
+    for symbol, (code, length) in codes.items():
+        if length <= lut_bits:
+            # Every prefix starting with this code decodes to it
+            start = code << (lut_bits - length)
+            end = start + (1 << (lut_bits - length))
+            lut_symbols[start:end] = int(symbol)
+            lut_lengths[start:end] = length
+    
+    return lut_symbols, lut_lengths
+
+
+@njit(cache=True)
+def _unpack_symbols(data, num_bits, lut_symbols, lut_lengths, lut_bits,
+                    children, symbols, out):
+    """Decode one symbol per table lookup, return number of symbols written to out"""
+    count = 0
+    pos = 0
+    mask = (1 << lut_bits) - 1
+    
+    # Rolling bit buffer: the low `avail` bits of buf are the next unread bits
+    buf = 0
+    avail = 0
+    byte_pos = 0
+    while pos < num_bits and count < out.shape[0]:
+        # Top up the buffer a byte at a time (bytes past the end read as zero)
+        while avail <= 48:
+            buf <<= 8
+            if byte_pos < data.shape[0]:
+                buf |= int(data[byte_pos])
+            byte_pos += 1
+            avail += 8
+        prefix = (buf >> (avail - lut_bits)) & mask
+        
+        length = lut_lengths[prefix]
+        if length > 0 and pos + length <= num_bits:
+            out[count] = lut_symbols[prefix]
+            pos += length
+            avail -= length
         else:
-            current = current.right
+            # Code longer than the table: walk the tree bit by bit
+            node = 0
+            while True:
+                if pos >= num_bits:
+                    raise ValueError("Truncated Huffman code in encoded data")
+                if avail == 0:
+                    buf = int(data[byte_pos]) if byte_pos < data.shape[0] else 0
+                    byte_pos += 1
+                    avail = 8
+                avail -= 1
+                bit = (buf >> avail) & 1
+                pos += 1
+                node = children[node, bit]
+                if node < 0:
+                    raise ValueError("Invalid Huffman code in encoded data")
+                if children[node, 0] < 0 and children[node, 1] < 0:  # Reached leaf
+                    break
+            out[count] = symbols[node]
+        buf &= (1 << avail) - 1
+        count += 1
+    return count
+
+
+def _decode_tables(codes):
+    """
+    Build the decoder lookup table and fallback tree for a code table
+    
+    Returns:
+        lut_bits, lut_symbols, lut_lengths, children, symbols
+    """
+    lut_bits = min(LUT_BITS, max(length for _, length in codes.values()))
+    lut_symbols, lut_lengths = _decode_lut(codes, lut_bits)
+    children, symbols = _decode_tree(codes)
+    return lut_bits, lut_symbols, lut_lengths, children, symbols
+
+
+@functools.lru_cache(maxsize=32)
+def decode_tables(huffman_table):
+    """
+    Decoder tables for a serialized Huffman table, cached by the table bytes
+    
+    Args:
+        huffman_table: bytes (serialized Huffman table)
         
-        if current.symbol is not None:  # Reached leaf
-            symbols.append(current.symbol)
-            current = root
+    Returns:
+        Tables for _unpack_symbols, or None for an empty table
+    """
+    codes, _ = deserialize_huffman_table(huffman_table)
+    return _decode_tables(codes) if codes else None
+
+
+def _decode_with_tables(encoded_data, tables, num_bits, num_symbols):
+    """Run the decoder kernel with prebuilt tables, return int16 symbols"""
+    out = np.zeros(num_symbols, dtype=np.int16)
+    if tables is None:
+        return out[:0]
     
-    return symbols
+    lut_bits, lut_symbols, lut_lengths, children, symbols = tables
+    
+    data = np.frombuffer(encoded_data, dtype=np.uint8)
+    count = _unpack_symbols(data, num_bits, lut_symbols, lut_lengths, lut_bits,
+                            children, symbols, out)
+    
+    return out[:count]
+
+
+def decode_huffman(encoded_data, codes, num_bits, num_symbols):
+    """
+    Decode Huffman-encoded bytes
+    
+    Args:
+        encoded_data: bytes
+        codes: Dict of {symbol: (code, code_length)}
+        num_bits: Number of valid bits in encoded_data
+        num_symbols: Maximum number of symbols to decode
+        
+    Returns:
+        int16 array of decoded symbols
+    """
+    tables = _decode_tables(codes) if codes else None
+    return _decode_with_tables(encoded_data, tables, num_bits, num_symbols)
 
 
 def serialize_huffman_table(codes):
@@ -126,7 +367,7 @@ def serialize_huffman_table(codes):
             symbol (2 bytes signed) + code_length (1 byte) + code (variable)
     
     Args:
-        codes: Dict of {symbol: code_string}
+        codes: Dict of {symbol: (code, code_length)}
         
     Returns:
         bytes
@@ -136,16 +377,16 @@ def serialize_huffman_table(codes):
     # Number of symbols
     data.extend(len(codes).to_bytes(2, byteorder='big'))
     
-    for symbol, code in codes.items():
+    for symbol, (code, length) in codes.items():
         # Symbol (2 bytes, signed int16)
         symbol_bytes = int(symbol).to_bytes(2, byteorder='big', signed=True)
         data.extend(symbol_bytes)
         
         # Code length
-        data.append(len(code))
+        data.append(length)
         
         # Code (pack bits into bytes)
-        code_bytes = int(code, 2).to_bytes((len(code) + 7) // 8, byteorder='big')
+        code_bytes = code.to_bytes((length + 7) // 8, byteorder='big')
         data.extend(code_bytes)
     
     return bytes(data)
@@ -159,7 +400,7 @@ def deserialize_huffman_table(data):
         data: bytes
         
     Returns:
-        codes dict, bytes_read
+        codes dict {symbol: (code, code_length)}, bytes_read
     """
     codes = {}
     offset = 0
@@ -179,51 +420,41 @@ def deserialize_huffman_table(data):
         
         # Code
         num_bytes = (code_length + 7) // 8
-        code_int = int.from_bytes(data[offset:offset+num_bytes], byteorder='big')
-        code = bin(code_int)[2:].zfill(code_length)
+        code = int.from_bytes(data[offset:offset+num_bytes], byteorder='big')
         offset += num_bytes
         
-        codes[symbol] = code
+        codes[symbol] = (code, code_length)
     
     return codes, offset
 
 
-def bitstring_to_bytes(bitstring):
+def bits_to_bytes(bits):
     """
-    Convert bitstring to bytes
+    Pack a bit array into bytes
     
     Args:
-        bitstring: String of '0' and '1'
+        bits: uint8 array of 0/1 values, MSB first
         
     Returns:
         bytes, padding_bits
     """
-    # Add padding
-    padding = (8 - len(bitstring) % 8) % 8
-    bitstring += '0' * padding
-    
-    # Convert to bytes
-    data = bytearray()
-    for i in range(0, len(bitstring), 8):
-        byte = int(bitstring[i:i+8], 2)
-        data.append(byte)
-    
-    return bytes(data), padding
+    bits = np.asarray(bits, dtype=np.uint8)
+    padding = (8 - len(bits) % 8) % 8
+    return np.packbits(bits, bitorder='big').tobytes(), padding
 
 
-def bytes_to_bitstring(data, num_bits):
+def bytes_to_bits(data, num_bits):
     """
-    Convert bytes to bitstring
+    Unpack bytes into a bit array
     
     Args:
         data: bytes
         num_bits: Number of bits to extract
         
     Returns:
-        Bitstring
+        uint8 array of 0/1 values, MSB first
     """
-    bitstring = ''.join(format(byte, '08b') for byte in data)
-    return bitstring[:num_bits]
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=num_bits, bitorder='big')
 
 
 def encode_coefficients(coeffs_list):
@@ -231,29 +462,24 @@ def encode_coefficients(coeffs_list):
     Encode list of coefficient arrays using Huffman coding
     
     Args:
-        coeffs_list: List of coefficient arrays
+        coeffs_list: List of coefficient arrays (or one stacked array)
         
     Returns:
         encoded_data (bytes), huffman_table (bytes), num_bits
     """
-    # Flatten all coefficients
-    all_coeffs = []
-    for coeffs in coeffs_list:
-        all_coeffs.extend(coeffs.flatten().tolist())
+    # Flatten all coefficients into one int16 array
+    all_coeffs = np.concatenate(coeffs_list, axis=None).astype(np.int16, copy=False)
     
     # Build frequency table
-    freq = Counter(all_coeffs)
+    symbols, counts = np.unique(all_coeffs, return_counts=True)
+    freq = dict(zip(symbols.tolist(), counts.tolist()))
     
     # Build Huffman tree and codes
     tree = build_huffman_tree(freq)
     codes = generate_huffman_codes(tree)
     
     # Encode
-    bitstring = encode_huffman(all_coeffs, codes)
-    num_bits = len(bitstring)
-    
-    # Convert to bytes
-    encoded_bytes, padding = bitstring_to_bytes(bitstring)
+    encoded_bytes, num_bits = encode_huffman(all_coeffs, codes)
     
     # Serialize Huffman table
     huffman_table = serialize_huffman_table(codes)
@@ -272,35 +498,11 @@ def decode_coefficients(encoded_data, huffman_table, num_bits, num_coeffs):
         num_coeffs: Total number of coefficients to decode
         
     Returns:
-        List of coefficients
+        int16 array of coefficients
     """
-    # Deserialize Huffman table
-    codes, _ = deserialize_huffman_table(huffman_table)
-    
-    # Rebuild tree from codes
-    root = HuffmanNode()
-    for symbol, code in codes.items():
-        node = root
-        for bit in code[:-1]:
-            if bit == '0':
-                if node.left is None:
-                    node.left = HuffmanNode()
-                node = node.left
-            else:
-                if node.right is None:
-                    node.right = HuffmanNode()
-                node = node.right
-        
-        # Last bit
-        if code[-1] == '0':
-            node.left = HuffmanNode(symbol=symbol, freq=0)
-        else:
-            node.right = HuffmanNode(symbol=symbol, freq=0)
-    
-    # Convert bytes to bitstring
-    bitstring = bytes_to_bitstring(encoded_data, num_bits)
+    # Decoder tables are cached per serialized table, so repeated decodes
+    # with the same codebook skip the rebuild
+    tables = decode_tables(bytes(huffman_table))
     
     # Decode
-    coeffs = decode_huffman(bitstring, root)
-    
-    return coeffs[:num_coeffs]  # Trim to exact count
+    return _decode_with_tables(encoded_data, tables, num_bits, num_coeffs)
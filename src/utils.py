@@ -31,13 +31,20 @@ def read_dicom(filepath):
 
 
 def save_raw_image(pixels, filepath, bit_depth=16):
-    """Save image as raw binary file"""
+    """
+    Save image as raw binary file
+    
+    uint16 input is written as is: it is assumed to be in range already
+    (decode_image clips to the bit depth before converting). Other dtypes
+    are clipped to [0, 2**bit_depth - 1] and converted to uint16.
+    """
     # Normalize to bit depth range
-    max_val = (1 << bit_depth) - 1
-    pixels_clipped = np.clip(pixels, 0, max_val)
+    if pixels.dtype != np.uint16:
+        max_val = (1 << bit_depth) - 1
+        pixels = np.clip(pixels, 0, max_val).astype(np.uint16)
     
     # Save as uint16 for 12-16 bit images
-    pixels_clipped.astype(np.uint16).tofile(filepath)
+    pixels.tofile(filepath)
     
 
 def load_raw_image(filepath, width, height):
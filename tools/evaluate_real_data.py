@@ -7,18 +7,18 @@ Uses SimpleITK to handle JPEG Lossless DICOM
 import os
 import sys
 import json
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import SimpleITK as sitk
 import matplotlib.pyplot as plt
 from pathlib import Path
-from skimage.metrics import structural_similarity as ssim
-from scipy.ndimage import sobel
+from scipy.ndimage import uniform_filter
 
 # Add src to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from dct_transform import dct2d, idct2d, create_quantization_matrix, quantize, dequantize, zigzag_flatten, zigzag_unflatten
-from huffman_coding import build_huffman_tree, generate_huffman_codes, encode_huffman, decode_huffman, serialize_huffman_table, deserialize_huffman_table
+from dct_transform import create_quantization_matrix, encode_blocks, decode_blocks
+from huffman_coding import build_huffman_tree, generate_huffman_codes, encode_huffman, serialize_huffman_table, decode_coefficients
 from bitstream import pack_bitstream, unpack_bitstream
 
 def read_dicom_sitk(dicom_path):
@@ -47,6 +47,27 @@ def read_dicom_sitk(dicom_path):
         print(f"Error reading {dicom_path}: {e}")
         return None
 
+def read_dicom_series(dicom_paths):
+    """
+    Read several single-slice DICOM files as one volume with a single
+    SimpleITK series reader (one decoder setup for all slices)
+    
+    Returns: float32 array of shape [slices, height, width], or None on error
+    """
+    try:
+        reader = sitk.ImageSeriesReader()
+        reader.SetFileNames([str(p) for p in dicom_paths])
+        volume = sitk.GetArrayFromImage(reader.Execute())
+        
+        if volume.ndim == 2:
+            volume = volume[np.newaxis]
+        
+        return volume.astype(np.float32, copy=False)
+        
+    except Exception as e:
+        print(f"Error reading DICOM series: {e}")
+        return None
+
 def encode_image_direct(image, quality=50):
     """
     Encode image array directly (no file I/O)
@@ -59,43 +80,28 @@ def encode_image_direct(image, quality=50):
     # Pad image
     pad_h = (block_size - height % block_size) % block_size
     pad_w = (block_size - width % block_size) % block_size
-    padded = np.pad(image, ((0, pad_h), (0, pad_w)), mode='edge')
+    padded = np.pad(np.asarray(image, dtype=np.float32), ((0, pad_h), (0, pad_w)), mode='edge')
 
     # Create quantization matrix
     quant_matrix = create_quantization_matrix(quality, block_size, bit_depth)
 
-    # Process blocks: DCT -> quantize -> zigzag
-    all_coeffs = []
-    for i in range(0, padded.shape[0], block_size):
-        for j in range(0, padded.shape[1], block_size):
-            block = padded[i:i+block_size, j:j+block_size]
-
-            dct_block = dct2d(block)
-            quant_block = quantize(dct_block, quant_matrix)
-            coeffs = zigzag_flatten(quant_block)
-            all_coeffs.extend(coeffs)
+    # Process all blocks at once: DCT -> quantize -> zigzag
+    all_coeffs = encode_blocks(padded, quant_matrix, block_size).ravel()
 
-    # Huffman encode
-    from collections import Counter
-    symbols_freq = Counter(all_coeffs)
+    # Huffman encode (frequencies counted on the int16 array, no boxed ints)
+    symbols, counts = np.unique(all_coeffs, return_counts=True)
+    symbols_freq = dict(zip(symbols.tolist(), counts.tolist()))
     huffman_tree = build_huffman_tree(symbols_freq)
     huffman_codes = generate_huffman_codes(huffman_tree)
-    encoded_bits = encode_huffman(all_coeffs, huffman_codes)
-    num_bits = len(encoded_bits)
+    encoded_bytes, num_bits = encode_huffman(all_coeffs, huffman_codes)
 
     # Serialize Huffman table
     huffman_table = serialize_huffman_table(huffman_codes)
 
-    # Convert bitstring to bytes
-    encoded_bytes = bytearray()
-    for i in range(0, len(encoded_bits), 8):
-        byte_str = encoded_bits[i:i+8].ljust(8, '0')
-        encoded_bytes.append(int(byte_str, 2))
-
     # Pack bitstream
     bitstream = pack_bitstream(
         width, height, bit_depth, block_size, quality,
-        quant_matrix, huffman_table, bytes(encoded_bytes), num_bits
+        quant_matrix, huffman_table, encoded_bytes, num_bits
     )
 
     return bitstream
@@ -120,82 +126,162 @@ def decode_image_direct(bitstream):
     encoded_data = params['encoded_data']
     num_bits = params['num_bits']
     
-    # Deserialize Huffman codes
-    huffman_codes, _ = deserialize_huffman_table(huffman_table)
-    
-    # Convert bytes to bitstring
-    bitstring = ''.join(f'{byte:08b}' for byte in encoded_data)[:num_bits]
-    
-    # Decode Huffman
-    decoded_coeffs = []
-    current = ''
-    code_to_symbol = {code: symbol for symbol, code in huffman_codes.items()}
-    
-    for bit in bitstring:
-        current += bit
-        if current in code_to_symbol:
-            decoded_coeffs.append(code_to_symbol[current])
-            current = ''
-    
-    coeffs = decoded_coeffs
-    
-    # Reconstruct blocks
+    # Padded dimensions
     pad_h = (block_size - height % block_size) % block_size
     pad_w = (block_size - width % block_size) % block_size
     padded_h = height + pad_h
     padded_w = width + pad_w
+    num_coeffs = padded_h * padded_w
     
-    reconstructed = np.zeros((padded_h, padded_w), dtype=np.float32)
+    # Decode Huffman (table lookup per symbol; tables cached per codebook)
+    coeffs = decode_coefficients(encoded_data, huffman_table, num_bits, num_coeffs)
+    if len(coeffs) != num_coeffs:
+        print(f"Error: Malformed bitstream - expected {num_coeffs} coefficients, got {len(coeffs)}")
+        return None
     
-    num_blocks_h = padded_h // block_size
-    num_blocks_w = padded_w // block_size
-    
-    coeff_idx = 0
-    for i in range(num_blocks_h):
-        for j in range(num_blocks_w):
-            # Get coefficients for this block
-            block_coeffs = coeffs[coeff_idx:coeff_idx + block_size * block_size]
-            coeff_idx += block_size * block_size
-            
-            # Inverse zigzag
-            quant_block = zigzag_unflatten(np.array(block_coeffs), block_size)
-            
-            # Dequantize
-            dct_block = dequantize(quant_block, quant_matrix)
-            
-            # IDCT
-            block = idct2d(dct_block)
-            
-            reconstructed[i*block_size:(i+1)*block_size, 
-                         j*block_size:(j+1)*block_size] = block
+    # Inverse zigzag, dequantize and IDCT all blocks at once
+    reconstructed = decode_blocks(coeffs, quant_matrix, padded_h, padded_w, block_size)
     
     # Unpad
     reconstructed = reconstructed[:height, :width]
     
     return reconstructed
 
-def calculate_metrics(original, reconstructed):
-    """Calculate RMSE, PSNR, SSIM, and edge-preservation RMSE/PSNR"""
-    rmse = np.sqrt(np.mean((original - reconstructed) ** 2))
-    max_val = 65535.0  # 16-bit
-    psnr = 20 * np.log10(max_val / rmse) if rmse > 0 else 100.0
+def sobel_magnitude(image):
+    """
+    Sobel gradient magnitude in float32, computed separably on one
+    edge-padded copy (same result as scipy.ndimage.sobel on both axes)
+    """
+    padded = np.pad(np.asarray(image, dtype=np.float32), 1, mode='edge')
+
+    # d/dy: smooth along rows [1 2 1], difference along columns [-1 0 1]
+    smooth = padded[:, :-2] + 2 * padded[:, 1:-1] + padded[:, 2:]
+    gx = smooth[2:] - smooth[:-2]
+
+    # d/dx: difference along rows, smooth along columns
+    diff = padded[:, 2:] - padded[:, :-2]
+    gy = diff[:-2] + 2 * diff[1:-1] + diff[2:]
+
+    gx *= gx
+    gy *= gy
+    gx += gy
+    return np.sqrt(gx, out=gx)
 
-    # SSIM expects data range and float64
-    ssim_val = ssim(original, reconstructed, data_range=max_val)
+# SSIM parameters (skimage structural_similarity defaults: 7x7 uniform
+# window, sample covariance, K1=0.01, K2=0.03)
+SSIM_WIN_SIZE = 7
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+
+class ReferenceMetrics:
+    """
+    Quality metrics against a fixed original image
+
+    Everything that depends only on the original (its Sobel edges and its
+    SSIM window mean/variance) is computed once here, so scoring several
+    reconstructions of the same slice only processes the reconstructions.
+    All arrays are float32.
+    """
+    def __init__(self, original, max_val=65535.0):
+        self.original = np.asarray(original, dtype=np.float32)
+        self.max_val = max_val  # 16-bit
 
-    # Edge preservation: Sobel magnitude
-    def sobel_mag(x):
-        gx = sobel(x, axis=0)
-        gy = sobel(x, axis=1)
-        return np.hypot(gx, gy)
+        # Edge preservation reference: Sobel magnitude
+        self.edge = sobel_magnitude(self.original)
+        edge_max = float(np.max(self.edge))
+        self.edge_max = edge_max if edge_max > 0 else 1.0
 
-    orig_edge = sobel_mag(original)
-    recon_edge = sobel_mag(reconstructed)
-    edge_rmse = np.sqrt(np.mean((orig_edge - recon_edge) ** 2))
-    edge_max = np.max(orig_edge) if np.max(orig_edge) > 0 else 1.0
-    edge_psnr = 20 * np.log10(edge_max / edge_rmse) if edge_rmse > 0 else 100.0
+        # SSIM window statistics of the original
+        self.mean = uniform_filter(self.original, SSIM_WIN_SIZE)
+        self.mean_sq = uniform_filter(self.original * self.original, SSIM_WIN_SIZE)
 
-    return rmse, psnr, ssim_val, edge_rmse, edge_psnr
+    def ssim(self, reconstructed):
+        """Mean SSIM, identical to skimage's structural_similarity defaults"""
+        x = self.original
+        y = reconstructed
+        num_pixels = SSIM_WIN_SIZE ** 2
+        cov_norm = num_pixels / (num_pixels - 1)  # sample covariance
+
+        ux = self.mean
+        uy = uniform_filter(y, SSIM_WIN_SIZE)
+        uyy = uniform_filter(y * y, SSIM_WIN_SIZE)
+        uxy = uniform_filter(x * y, SSIM_WIN_SIZE)
+        vx = cov_norm * (self.mean_sq - ux * ux)
+        vy = cov_norm * (uyy - uy * uy)
+        vxy = cov_norm * (uxy - ux * uy)
+
+        c1 = (SSIM_K1 * self.max_val) ** 2
+        c2 = (SSIM_K2 * self.max_val) ** 2
+        s = ((2 * ux * uy + c1) * (2 * vxy + c2)) / ((ux * ux + uy * uy + c1) * (vx + vy + c2))
+
+        # Ignore the filter radius strip around the edges
+        pad = (SSIM_WIN_SIZE - 1) // 2
+        return s[pad:-pad, pad:-pad].mean(dtype=np.float64)
+
+    def compare(self, reconstructed):
+        """Calculate RMSE, PSNR, SSIM, and edge-preservation RMSE/PSNR"""
+        reconstructed = np.asarray(reconstructed, dtype=np.float32)
+
+        err = self.original - reconstructed
+        err *= err
+        rmse = np.sqrt(np.mean(err))
+        psnr = 20 * np.log10(self.max_val / rmse) if rmse > 0 else 100.0
+
+        ssim_val = self.ssim(reconstructed)
+
+        # Edge preservation: Sobel magnitude
+        edge_err = self.edge - sobel_magnitude(reconstructed)
+        edge_err *= edge_err
+        edge_rmse = np.sqrt(np.mean(edge_err))
+        edge_psnr = 20 * np.log10(self.edge_max / edge_rmse) if edge_rmse > 0 else 100.0
+
+        return rmse, psnr, ssim_val, edge_rmse, edge_psnr
+
+def calculate_metrics(original, reconstructed):
+    """Calculate RMSE, PSNR, SSIM, and edge-preservation RMSE/PSNR"""
+    return ReferenceMetrics(original).compare(reconstructed)
+
+def evaluate_quality(image, quality, reference=None):
+    """
+    Encode, decode and score one slice at one quality level
+    Returns: dict of compression and quality metrics
+    """
+    # Encode
+    bitstream = encode_image_direct(image, quality)
+    compressed_size = len(bitstream)
+    
+    # Decode
+    reconstructed = decode_image_direct(bitstream)
+    
+    # Calculate metrics
+    if reference is None:
+        reference = ReferenceMetrics(image)
+    rmse, psnr, ssim_val, edge_rmse, edge_psnr = reference.compare(reconstructed)
+    
+    # Calculate compression metrics
+    original_size = image.size * 2  # 16-bit = 2 bytes per pixel
+    bpp = (compressed_size * 8) / image.size
+    ratio = original_size / compressed_size
+    
+    return {
+        'compressed_bytes': int(compressed_size),
+        'bits_per_pixel': float(bpp),
+        'compression_ratio': float(ratio),
+        'rmse': float(rmse),
+        'psnr_db': float(psnr),
+        'ssim': float(ssim_val),
+        'edge_rmse': float(edge_rmse),
+        'edge_psnr_db': float(edge_psnr)
+    }
+
+def evaluate_slice(image, quality_levels):
+    """
+    Evaluate one slice at every quality level, sharing the reference
+    image statistics between them
+    Returns: dict of {quality: metrics dict}
+    """
+    reference = ReferenceMetrics(image)
+    return {quality: evaluate_quality(image, quality, reference) for quality in quality_levels}
 
 def evaluate_real_medimodel():
     """
@@ -220,62 +306,56 @@ def evaluate_real_medimodel():
     print(f"Evaluating {len(slice_indices)} slices at {len(quality_levels)} quality levels...")
     print(f"Output directory: {output_dir}\n")
     
+    # Collect the slices that exist
+    dicom_files = []
     for idx in slice_indices:
         dicom_file = f'I{idx}.dcm'
-        dicom_path = os.path.join(dicom_dir, dicom_file)
-        
-        if not os.path.exists(dicom_path):
+        if not os.path.exists(os.path.join(dicom_dir, dicom_file)):
             print(f"⚠ Skipping {dicom_file} (not found)")
             continue
-        
-        print(f"Processing {dicom_file}...")
-        
-        # Read DICOM
-        image = read_dicom_sitk(dicom_path)
-        if image is None:
-            print(f"  ✗ Failed to read")
-            continue
-        
-        print(f"  Shape: {image.shape}, Range: [{image.min():.0f}, {image.max():.0f}]")
-        
-        slice_result = {
-            'slice': dicom_file,
-            'shape': [int(s) for s in image.shape],
-            'value_range': [float(image.min()), float(image.max())],
-            'qualities': {}
+        dicom_files.append(dicom_file)
+    dicom_paths = [os.path.join(dicom_dir, f) for f in dicom_files]
+    
+    # Read all slices in one pass; fall back to one reader per file
+    volume = read_dicom_series(dicom_paths) if dicom_paths else None
+    if volume is None or len(volume) != len(dicom_paths):
+        volume = [read_dicom_sitk(path) for path in dicom_paths]
+    
+    # Slices are independent: evaluate them on a process pool (all quality
+    # levels of a slice in one job, so its reference statistics are computed
+    # once) and report the results in the original order
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = {
+            dicom_file: executor.submit(evaluate_slice, image, quality_levels)
+            for dicom_file, image in zip(dicom_files, volume) if image is not None
         }
         
-        for quality in quality_levels:
-            # Encode
-            bitstream = encode_image_direct(image, quality)
-            compressed_size = len(bitstream)
-            
-            # Decode
-            reconstructed = decode_image_direct(bitstream)
+        for dicom_file, image in zip(dicom_files, volume):
+            print(f"Processing {dicom_file}...")
             
-            # Calculate metrics
-            rmse, psnr, ssim_val, edge_rmse, edge_psnr = calculate_metrics(image, reconstructed)
+            if image is None:
+                print(f"  ✗ Failed to read")
+                continue
             
-            # Calculate compression metrics
-            original_size = image.size * 2  # 16-bit = 2 bytes per pixel
-            bpp = (compressed_size * 8) / image.size
-            ratio = original_size / compressed_size
+            print(f"  Shape: {image.shape}, Range: [{image.min():.0f}, {image.max():.0f}]")
             
-            slice_result['qualities'][str(quality)] = {
-                'compressed_bytes': int(compressed_size),
-                'bits_per_pixel': float(bpp),
-                'compression_ratio': float(ratio),
-                'rmse': float(rmse),
-                'psnr_db': float(psnr),
-                'ssim': float(ssim_val),
-                'edge_rmse': float(edge_rmse),
-                'edge_psnr_db': float(edge_psnr)
+            slice_result = {
+                'slice': dicom_file,
+                'shape': [int(s) for s in image.shape],
+                'value_range': [float(image.min()), float(image.max())],
+                'qualities': {}
             }
             
-            print(f"    Q={quality}: {compressed_size:,} bytes, {bpp:.3f} bpp, {ratio:.2f}:1, PSNR={psnr:.2f} dB")
-        
-        results['results'].append(slice_result)
-        results['slices_evaluated'].append(dicom_file)
+            for quality in quality_levels:
+                metrics = futures[dicom_file].result()[quality]
+                slice_result['qualities'][str(quality)] = metrics
+                
+                print(f"    Q={quality}: {metrics['compressed_bytes']:,} bytes, "
+                      f"{metrics['bits_per_pixel']:.3f} bpp, {metrics['compression_ratio']:.2f}:1, "
+                      f"PSNR={metrics['psnr_db']:.2f} dB")
+            
+            results['results'].append(slice_result)
+            results['slices_evaluated'].append(dicom_file)
     
     # Save results
     results_file = os.path.join(output_dir, 'medimodel_results.json')
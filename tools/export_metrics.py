@@ -7,9 +7,22 @@ Reads medimodel_results.json and generates:
 """
 
 import json
-import csv
 from pathlib import Path
 
+import pandas as pd
+
+# Metric key in the results JSON -> (CSV column, CSV number format)
+METRIC_COLUMNS = {
+    'compressed_bytes': ('Compressed_Bytes', '{:d}'),
+    'bits_per_pixel': ('Bits_Per_Pixel', '{:.4f}'),
+    'compression_ratio': ('Compression_Ratio', '{:.2f}'),
+    'rmse': ('RMSE', '{:.2f}'),
+    'psnr_db': ('PSNR_dB', '{:.2f}'),
+    'ssim': ('SSIM', '{:.4f}'),
+    'edge_rmse': ('Edge_RMSE', '{:.2f}'),
+    'edge_psnr_db': ('Edge_PSNR_dB', '{:.2f}'),
+}
+
 def export_metrics():
     results_dir = Path('/workspace/MMIP_hw2/results_real')
     input_json = results_dir / 'medimodel_results.json'
@@ -20,65 +33,35 @@ def export_metrics():
     with open(input_json, 'r', encoding='utf-8') as f:
         data = json.load(f)
     
-    # Prepare CSV data
-    csv_rows = []
-    header = [
-        'Slice', 'Quality', 'Compressed_Bytes', 'Bits_Per_Pixel', 
-        'Compression_Ratio', 'RMSE', 'PSNR_dB', 'SSIM', 'Edge_RMSE', 'Edge_PSNR_dB'
-    ]
+    # One row per (slice, quality)
+    df = pd.DataFrame([
+        {'slice': result['slice'], 'quality': int(quality_str), **metrics}
+        for result in data['results']
+        for quality_str, metrics in result['qualities'].items()
+    ], columns=['slice', 'quality', *METRIC_COLUMNS])
     
-    for result in data['results']:
-        slice_name = result['slice']
-        for quality_str, metrics in result['qualities'].items():
-            row = [
-                slice_name,
-                quality_str,
-                metrics['compressed_bytes'],
-                f"{metrics['bits_per_pixel']:.4f}",
-                f"{metrics['compression_ratio']:.2f}",
-                f"{metrics['rmse']:.2f}",
-                f"{metrics['psnr_db']:.2f}",
-                f"{metrics['ssim']:.4f}",
-                f"{metrics['edge_rmse']:.2f}",
-                f"{metrics['edge_psnr_db']:.2f}"
-            ]
-            csv_rows.append(row)
-    
-    # Write CSV
-    with open(output_csv, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(header)
-        writer.writerows(csv_rows)
+    # Write CSV (each metric keeps its own precision)
+    csv_df = pd.DataFrame({'Slice': df['slice'], 'Quality': df['quality']})
+    for key, (column, fmt) in METRIC_COLUMNS.items():
+        csv_df[column] = df[key].map(fmt.format)
+    csv_df.to_csv(output_csv, index=False, encoding='utf-8', lineterminator='\r\n')
     
     print(f"✓ CSV exported: {output_csv}")
-    print(f"  Rows: {len(csv_rows)} (header + {len(csv_rows)} data rows)")
+    print(f"  Rows: {len(csv_df)} (header + {len(csv_df)} data rows)")
     
     # Calculate averages per quality
     qualities = [30, 60, 90]
+    averages = df.groupby('quality')[list(METRIC_COLUMNS)].mean()
     summary = {
         'dataset': data['dataset'],
         'source': data['source'],
         'slices_evaluated': data['slices_evaluated'],
         'quality_levels': qualities,
-        'average_metrics': {}
-    }
-    
-    for quality in qualities:
-        q_str = str(quality)
-        metrics_list = [r['qualities'][q_str] for r in data['results']]
-        
-        avg = {
-            'compressed_bytes': sum(m['compressed_bytes'] for m in metrics_list) / len(metrics_list),
-            'bits_per_pixel': sum(m['bits_per_pixel'] for m in metrics_list) / len(metrics_list),
-            'compression_ratio': sum(m['compression_ratio'] for m in metrics_list) / len(metrics_list),
-            'rmse': sum(m['rmse'] for m in metrics_list) / len(metrics_list),
-            'psnr_db': sum(m['psnr_db'] for m in metrics_list) / len(metrics_list),
-            'ssim': sum(m['ssim'] for m in metrics_list) / len(metrics_list),
-            'edge_rmse': sum(m['edge_rmse'] for m in metrics_list) / len(metrics_list),
-            'edge_psnr_db': sum(m['edge_psnr_db'] for m in metrics_list) / len(metrics_list)
+        'average_metrics': {
+            str(quality): {key: float(value) for key, value in averages.loc[quality].items()}
+            for quality in qualities
         }
-        
-        summary['average_metrics'][q_str] = avg
+    }
     
     # Write summary JSON
     with open(output_summary_json, 'w', encoding='utf-8') as f:
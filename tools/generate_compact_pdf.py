@@ -4,9 +4,10 @@ Generate compact PDF report (6-10 pages)
 """
 
 import markdown2
-from weasyprint import HTML
 from pathlib import Path
 
+from pdf_render import render_pdf
+
 def generate_compact_pdf():
     md_file = Path('/workspace/MMIP_hw2/docs/FINAL_REPORT_COMPACT.md')
     pdf_file = Path('/workspace/MMIP_hw2/docs/FINAL_REPORT.pdf')
@@ -171,8 +172,8 @@ def generate_compact_pdf():
     with open(html_file, 'w', encoding='utf-8') as f:
         f.write(full_html)
     
-    # Generate PDF
-    HTML(string=full_html).write_pdf(pdf_file)
+    # Generate PDF (skipped if the HTML is unchanged since the last render)
+    render_pdf(full_html, pdf_file)
     
     print(f"✓ 精簡版 PDF 已生成: {pdf_file}")
     
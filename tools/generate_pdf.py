@@ -179,14 +179,11 @@ def markdown_to_html(md_path):
 
 def html_to_pdf_weasyprint(html_content, output_pdf):
     """Convert HTML to PDF using weasyprint"""
-    from weasyprint import HTML, CSS
+    from pdf_render import render_pdf
     
-    # Create HTML object
-    html_obj = HTML(string=html_content)
-    
-    # Generate PDF
-    html_obj.write_pdf(output_pdf)
-    print(f"✓ PDF generated: {output_pdf}")
+    # Generate PDF (skipped if the HTML is unchanged since the last render)
+    if render_pdf(html_content, output_pdf):
+        print(f"✓ PDF generated: {output_pdf}")
 
 def main():
     md_path = Path('/workspace/MMIP_hw2/docs/FINAL_REPORT.md')
@@ -5,13 +5,68 @@ Convert FINAL_REPORT.md to PDF using pandoc with LaTeX math support
 
 import subprocess
 import os
+import re
+import sys
+import threading
+from collections import deque
 from pathlib import Path
 
-def generate_pdf_with_pandoc():
-    """Use pandoc to convert markdown to PDF with proper LaTeX rendering"""
+from pdf_stamp import input_digest, is_up_to_date, write_stamp
+
+def embedded_images(md_file, markdown):
+    """Local image files embedded in the markdown"""
+    images = []
+    for target in re.findall(r'!\[[^\]]*\]\(([^)\s]+)', markdown):
+        images.append((md_file.parent / target.replace('file://', '')).resolve())
+    return images
+
+# How much of pandoc/xelatex's stderr to keep for the error message
+STDERR_TAIL_LINES = 50
+
+def run_with_stderr_tail(cmd, timeout):
+    """
+    Run a command, streaming its stderr and keeping only the last lines
+    (xelatex logs can be long; memory stays constant)
+    
+    Returns:
+        (returncode, stderr tail); returncode is None if the command timed out
+    """
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    timer = threading.Timer(timeout, proc.kill)
+    timer.start()
+    try:
+        for line in proc.stderr:
+            stderr_tail.append(line)
+        returncode = proc.wait()
+    finally:
+        timed_out = not timer.is_alive()
+        timer.cancel()
+        proc.stderr.close()
+    return (None if timed_out else returncode), ''.join(stderr_tail)
+
+# Draft builds: xdvipdfmx without image compression (-z0), and xelatex
+# in batch mode so it doesn't echo its whole log
+DRAFT_ENGINE_OPTS = [
+    '--pdf-engine-opt=-output-driver=xdvipdfmx -z0',
+    '--pdf-engine-opt=-interaction=batchmode',
+]
+
+def generate_pdf_with_pandoc(force=False, draft=False):
+    """
+    Use pandoc to convert markdown to PDF with proper LaTeX rendering
+    
+    draft=True writes a quick preview (FINAL_REPORT.draft.pdf) with
+    uncompressed images, for iterating on the report
+    """
     
     md_file = Path('/workspace/MMIP_hw2/docs/FINAL_REPORT.md')
-    pdf_file = Path('/workspace/MMIP_hw2/docs/FINAL_REPORT.pdf')
+    pdf_file = Path('/workspace/MMIP_hw2/docs/FINAL_REPORT.draft.pdf' if draft
+                    else '/workspace/MMIP_hw2/docs/FINAL_REPORT.pdf')
+    
+    if not md_file.exists():
+        print(f"✗ {md_file} not found")
+        return False
     
     # Check if pandoc is available
     try:
@@ -36,29 +91,43 @@ def generate_pdf_with_pandoc():
         '--from=markdown',
         '--to=pdf'
     ]
+    if draft:
+        cmd += DRAFT_ENGINE_OPTS
+    
+    # Skip the (slow) pandoc + xelatex run if this PDF was built by this
+    # command from the same markdown and images, and nothing rewrote it since
+    markdown = md_file.read_text(encoding='utf-8')
+    digest = input_digest('\0'.join(cmd + [markdown]), embedded_images(md_file, markdown))
+    if not force and is_up_to_date(pdf_file, digest):
+        print(f"✓ PDF up to date, skipped pandoc: {pdf_file}")
+        return True
     
     print("Generating PDF with pandoc + xelatex...")
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-        if result.returncode == 0:
+        returncode, stderr_tail = run_with_stderr_tail(cmd, timeout=30 if draft else 60)
+        if returncode is None:
+            print("✗ PDF generation timed out")
+            return False
+        if returncode == 0:
             file_size = pdf_file.stat().st_size / 1024
+            write_stamp(pdf_file, digest)
             print(f"✓ PDF generated: {pdf_file}")
             print(f"  Size: {file_size:.1f} KB")
             return True
         else:
             print(f"✗ Pandoc error:")
-            print(result.stderr)
+            print(stderr_tail)
             return False
-    except subprocess.TimeoutExpired:
-        print("✗ PDF generation timed out")
-        return False
     except Exception as e:
         print(f"✗ Error: {e}")
         return False
 
 if __name__ == '__main__':
-    if generate_pdf_with_pandoc():
-        print("\n✓ Report ready for delivery")
+    draft = '--draft' in sys.argv[1:]
+    if generate_pdf_with_pandoc(force='--force' in sys.argv[1:], draft=draft):
+        print("\n✓ Draft ready for preview" if draft else "\n✓ Report ready for delivery")
+    elif draft:
+        print("\n✗ Draft build failed")
     else:
         print("\n⚠ Falling back to previous PDF generation method")
         # Try to use the existing markdown2 method
@@ -6,60 +6,122 @@ import numpy as np
 import pydicom
 from pydicom.dataset import Dataset, FileDataset
 from pydicom.uid import ExplicitVRLittleEndian
+import copy
 import datetime
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 
-def create_synthetic_ct(width=512, height=512, bit_depth=16):
+# Raw value per label of create_synthetic_ct's label map:
+# air, soft tissue (HU ~ 2000 in raw units), bone (~4000), lung (~800), heart/muscle
+STRUCTURE_VALUES = np.array([0, 2000, 4000, 800, 2200], dtype=np.float32)
+
+
+def create_synthetic_ct(width=512, height=512, bit_depth=16, rng=None):
     """
     Create synthetic CT-like image with various structures
     
+    Args:
+        width, height: Image size
+        bit_depth: Bit depth of the output values
+        rng: numpy Generator for the noise (default: freshly seeded)
+    
     Returns:
         2D numpy array with 16-bit values
     """
-    # Create base image
-    image = np.zeros((height, width), dtype=np.uint16)
-    
-    # Background (air)
-    image[:] = 0
+    # Structures are painted into a small label map in z-order (each later
+    # shape covers the earlier ones); one LUT gather at the end turns labels
+    # into raw values. Label 0 is the background (air)
+    label = np.zeros((height, width), dtype=np.uint8)
+    
+    # Coordinates as int32 row/column vectors; every disk mask below reuses
+    # the same distance and mask buffers instead of allocating temporaries
+    y = np.arange(height, dtype=np.int32)[:, None]
+    x = np.arange(width, dtype=np.int32)[None, :]
+    dist_buf = np.empty((height, width), dtype=np.int32)
+    mask_buf = np.empty((height, width), dtype=bool)
+    hit_buf = np.empty((height, width), dtype=bool)
+    
+    def disk_mask(cx, cy, r):
+        """Mask of pixels within r of any of the centres (cx, cy)"""
+        dx2 = (x - np.atleast_1d(cx).astype(np.int32)[:, None])**2
+        dy2 = (y.T - np.atleast_1d(cy).astype(np.int32)[:, None])**2
+        mask_buf.fill(False)
+        for k in range(dx2.shape[0]):
+            np.add(dy2[k][:, None], dx2[k], out=dist_buf)
+            np.less_equal(dist_buf, r * r, out=hit_buf)
+            np.logical_or(mask_buf, hit_buf, out=mask_buf)
+        return mask_buf
     
     # Soft tissue circle (body outline)
     center_x, center_y = width // 2, height // 2
     radius = min(width, height) // 3
-    y, x = np.ogrid[:height, :width]
-    mask_body = (x - center_x)**2 + (y - center_y)**2 <= radius**2
-    image[mask_body] = 2000  # Soft tissue HU ~ 2000 in raw units
+    np.copyto(label, 1, where=disk_mask(center_x, center_y, radius))  # Soft tissue
     
     # Bone structures (ribs)
-    for angle in np.linspace(0, 2*np.pi, 8, endpoint=False):
-        rib_x = int(center_x + radius * 0.7 * np.cos(angle))
-        rib_y = int(center_y + radius * 0.7 * np.sin(angle))
-        rib_radius = 20
-        mask_rib = (x - rib_x)**2 + (y - rib_y)**2 <= rib_radius**2
-        image[mask_rib] = 4000  # Bone HU ~ 4000 in raw units
+    angles = np.linspace(0, 2*np.pi, 8, endpoint=False)
+    rib_x = (center_x + radius * 0.7 * np.cos(angles)).astype(np.int32)
+    rib_y = (center_y + radius * 0.7 * np.sin(angles)).astype(np.int32)
+    rib_radius = 20
+    np.copyto(label, 2, where=disk_mask(rib_x, rib_y, rib_radius))  # Bone
     
     # Lung-like regions (dark circles)
     lung_offset = radius // 3
-    for dx in [-lung_offset, lung_offset]:
-        lung_x = center_x + dx
-        lung_y = center_y - lung_offset // 2
-        lung_radius = radius // 4
-        mask_lung = (x - lung_x)**2 + (y - lung_y)**2 <= lung_radius**2
-        image[mask_lung] = 800  # Lung HU ~ 800 in raw units
+    lung_x = center_x + np.array([-lung_offset, lung_offset])
+    lung_y = center_y - lung_offset // 2
+    lung_radius = radius // 4
+    np.copyto(label, 3, where=disk_mask(lung_x, [lung_y, lung_y], lung_radius))  # Lung
     
     # Heart-like structure
     heart_x = center_x
     heart_y = center_y + lung_offset // 2
     heart_radius = radius // 5
-    mask_heart = (x - heart_x)**2 + (y - heart_y)**2 <= heart_radius**2
-    image[mask_heart] = 2200  # Heart/muscle
+    np.copyto(label, 4, where=disk_mask(heart_x, heart_y, heart_radius))  # Heart/muscle
     
-    # Add some Gaussian noise
-    noise = np.random.normal(0, 50, (height, width))
-    image = image.astype(np.float32) + noise
-    image = np.clip(image, 0, (1 << bit_depth) - 1)
+    # Add some Gaussian noise (one float32 buffer: draw, scale, add and clip in place)
+    if rng is None:
+        rng = np.random.default_rng()
+    noisy = rng.standard_normal((height, width), dtype=np.float32)
+    noisy *= 50
+    noisy += STRUCTURE_VALUES[label]
+    np.clip(noisy, 0, (1 << bit_depth) - 1, out=noisy)
     
-    return image.astype(np.uint16)
+    return noisy.astype(np.uint16)
+
+
+# Shared DICOM header: file meta and every attribute that does not depend on
+# the image are built once; save_as_dicom copies them and fills in the pixels
+_FILE_META = Dataset()
+_FILE_META.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.2'  # CT Image Storage
+_FILE_META.MediaStorageSOPInstanceUID = '1.2.3.4.5.6.7.8.9'
+_FILE_META.TransferSyntaxUID = ExplicitVRLittleEndian
+
+_NOW = datetime.datetime.now()
+
+_TEMPLATE_DS = Dataset()
+# Patient info
+_TEMPLATE_DS.PatientName = "Test^Patient"
+_TEMPLATE_DS.PatientID = "TEST001"
+# Study info
+_TEMPLATE_DS.StudyDate = _NOW.strftime('%Y%m%d')
+_TEMPLATE_DS.StudyTime = _NOW.strftime('%H%M%S')
+_TEMPLATE_DS.StudyInstanceUID = '1.2.3.4.5.6.7.8'
+_TEMPLATE_DS.SeriesInstanceUID = '1.2.3.4.5.6.7.8.9'
+_TEMPLATE_DS.SOPInstanceUID = '1.2.3.4.5.6.7.8.9.10'
+# Image info
+_TEMPLATE_DS.Modality = 'CT'
+_TEMPLATE_DS.SeriesNumber = 1
+_TEMPLATE_DS.InstanceNumber = 1
+# Image pixel format
+_TEMPLATE_DS.SamplesPerPixel = 1
+_TEMPLATE_DS.PhotometricInterpretation = "MONOCHROME2"
+_TEMPLATE_DS.BitsAllocated = 16
+_TEMPLATE_DS.BitsStored = 16
+_TEMPLATE_DS.HighBit = 15
+_TEMPLATE_DS.PixelRepresentation = 0  # Unsigned
+
+_PREAMBLE = b"\0" * 128
 
 
 def save_as_dicom(image, filepath, modality='CT'):
@@ -71,41 +133,14 @@ def save_as_dicom(image, filepath, modality='CT'):
         filepath: Output path
         modality: DICOM modality (CT, MR, etc.)
     """
-    # Create file meta information
-    file_meta = Dataset()
-    file_meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.2'  # CT Image Storage
-    file_meta.MediaStorageSOPInstanceUID = '1.2.3.4.5.6.7.8.9'
-    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
-    
-    # Create DICOM dataset
-    ds = FileDataset(filepath, {}, file_meta=file_meta, preamble=b"\0" * 128)
-    
-    # Patient info
-    ds.PatientName = "Test^Patient"
-    ds.PatientID = "TEST001"
-    
-    # Study info
-    ds.StudyDate = datetime.datetime.now().strftime('%Y%m%d')
-    ds.StudyTime = datetime.datetime.now().strftime('%H%M%S')
-    ds.StudyInstanceUID = '1.2.3.4.5.6.7.8'
-    ds.SeriesInstanceUID = '1.2.3.4.5.6.7.8.9'
-    ds.SOPInstanceUID = '1.2.3.4.5.6.7.8.9.10'
-    
-    # Image info
-    ds.Modality = modality
-    ds.SeriesNumber = 1
-    ds.InstanceNumber = 1
+    # Copy the shared header
+    ds = FileDataset(filepath, copy.deepcopy(_TEMPLATE_DS),
+                     file_meta=copy.deepcopy(_FILE_META), preamble=_PREAMBLE)
     
-    # Image pixel data
-    ds.SamplesPerPixel = 1
-    ds.PhotometricInterpretation = "MONOCHROME2"
+    # Per-image attributes
+    ds.Modality = modality
     ds.Rows = image.shape[0]
     ds.Columns = image.shape[1]
-    ds.BitsAllocated = 16
-    ds.BitsStored = 16
-    ds.HighBit = 15
-    ds.PixelRepresentation = 0  # Unsigned
-    
     ds.PixelData = image.tobytes()
     
     # Save
@@ -113,6 +148,15 @@ def save_as_dicom(image, filepath, modality='CT'):
     print(f"Saved DICOM: {filepath}")
 
 
+def generate_one(config, test_dir):
+    """Generate and save one test image; returns (mean, std) of its pixels"""
+    # Seed from the file name so every config gets its own reproducible noise
+    rng = np.random.default_rng(zlib.crc32(config['name'].encode()))
+    image = create_synthetic_ct(config['width'], config['height'], rng=rng)
+    save_as_dicom(image, test_dir / config['name'])
+    return image.mean(), image.std()
+
+
 def main():
     """Generate test images"""
     # Create output directory
@@ -128,11 +172,12 @@ def main():
         {'name': 'ct_1024x1024.dcm', 'width': 1024, 'height': 1024},
     ]
     
-    for config in configs:
-        image = create_synthetic_ct(config['width'], config['height'])
-        filepath = test_dir / config['name']
-        save_as_dicom(image, filepath)
-        print(f"  Size: {config['width']}x{config['height']}, Mean: {image.mean():.1f}, Std: {image.std():.1f}")
+    # Images are independent: generate them in parallel
+    with ProcessPoolExecutor(max_workers=len(configs)) as executor:
+        stats = list(executor.map(generate_one, configs, [test_dir] * len(configs)))
+    
+    for config, (mean, std) in zip(configs, stats):
+        print(f"  Size: {config['width']}x{config['height']}, Mean: {mean:.1f}, Std: {std:.1f}")
     
     print(f"\n✓ Generated {len(configs)} test images in {test_dir}/")
 
@@ -5,161 +5,169 @@
 
 import json
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # 只輸出 PNG，不需要 GUI 後端
 import matplotlib.pyplot as plt
+from matplotlib import font_manager
 from pathlib import Path
 
 # 從評估腳本重用 DICOM 讀取與編解碼流程
 from evaluate_real_data import read_dicom_sitk, encode_image_direct, decode_image_direct
 
 # 設定中文字體（優先使用 Noto CJK，缺字時再回退）
-plt.rcParams['font.family'] = 'sans-serif'
-plt.rcParams['font.sans-serif'] = [
+# 啟動時只解析一次已安裝的字體，之後繪字不必再逐一搜尋不存在的字體
+FONT_CANDIDATES = [
     'Noto Sans CJK TC', 'Noto Sans CJK SC', 'Noto Sans CJK JP',
     'Noto Sans', 'DejaVu Sans'
 ]
+_installed_fonts = {font.name for font in font_manager.fontManager.ttflist}
+plt.rcParams['font.family'] = [name for name in FONT_CANDIDATES if name in _installed_fonts] or ['DejaVu Sans']
 plt.rcParams['axes.unicode_minus'] = False
 
-# 讀取結果
-results_file = '/workspace/MMIP_hw2/results_real/medimodel_results.json'
-with open(results_file, 'r', encoding='utf-8') as f:
-    data = json.load(f)
-
-# 提取數據
-qualities = [30, 60, 90]
-psnr_values = {}
-compression_values = {}
-bpp_values = {}
-
-for quality in qualities:
-    psnr_list = []
-    compression_list = []
-    bpp_list = []
+# 300 dpi 輸出；PNG 以 zlib 等級 1 壓縮（檔案略大，但存檔快很多）
+SAVEFIG_OPTIONS = {
+    'dpi': 300,
+    'bbox_inches': 'tight',
+    'pil_kwargs': {'compress_level': 1, 'optimize': False},
+}
+
+RESULTS_FILE = '/workspace/MMIP_hw2/results_real/medimodel_results.json'
+QUALITIES = [30, 60, 90]
+
+METRIC_KEYS = ('psnr_db', 'compression_ratio', 'bits_per_pixel')
+
+def collect_metrics(data, qualities=QUALITIES):
+    """
+    把結果 JSON 攤平成陣列（只做一次字典查找）
     
-    for result in data['results']:
-        q_data = result['qualities'][str(quality)]
-        psnr_list.append(q_data['psnr_db'])
-        compression_list.append(q_data['compression_ratio'])
-        bpp_list.append(q_data['bits_per_pixel'])
+    Returns:
+        (切片數, 品質數, 指標數) 的 float64 陣列，指標順序同 METRIC_KEYS
+    """
+    return np.array([[[result['qualities'][str(q)][k] for k in METRIC_KEYS]
+                      for q in qualities]
+                     for result in data['results']], dtype=np.float64)
+
+def average_metrics(metrics, qualities=QUALITIES):
+    """
+    對所有切片平均各品質的 PSNR / 壓縮率 / bpp（一次 NumPy 聚合）
     
-    psnr_values[quality] = np.mean(psnr_list)
-    compression_values[quality] = np.mean(compression_list)
-    bpp_values[quality] = np.mean(bpp_list)
-
-# 創建圖表
-fig, axes = plt.subplots(1, 3, figsize=(15, 4))
-
-# 1. PSNR vs Quality
-ax = axes[0]
-psnr_list = [psnr_values[q] for q in qualities]
-colors = ['#FF6B6B', '#4ECDC4', '#45B7D1']
-bars1 = ax.bar(range(len(qualities)), psnr_list, color=colors, alpha=0.8, edgecolor='black', linewidth=2)
-ax.set_xticks(range(len(qualities)))
-ax.set_xticklabels([f'Q={q}' for q in qualities], fontsize=14, fontweight='bold')
-ax.set_ylabel('PSNR (dB)', fontsize=14, fontweight='bold')
-ax.set_title('品質 vs PSNR\n(越高越好)', fontsize=15, fontweight='bold')
-ax.grid(axis='y', alpha=0.3, linestyle='--')
-for i, (bar, val) in enumerate(zip(bars1, psnr_list)):
-    height = bar.get_height()
-    ax.text(bar.get_x() + bar.get_width()/2., height,
-            f'{val:.2f} dB', ha='center', va='bottom', fontsize=12, fontweight='bold')
-
-# 2. Compression Ratio vs Quality
-ax = axes[1]
-comp_list = [compression_values[q] for q in qualities]
-bars2 = ax.bar(range(len(qualities)), comp_list, color=colors, alpha=0.8, edgecolor='black', linewidth=2)
-ax.set_xticks(range(len(qualities)))
-ax.set_xticklabels([f'Q={q}' for q in qualities], fontsize=14, fontweight='bold')
-ax.set_ylabel('壓縮率 (:1)', fontsize=14, fontweight='bold')
-ax.set_title('品質 vs 壓縮率\n(越高越好)', fontsize=15, fontweight='bold')
-ax.grid(axis='y', alpha=0.3, linestyle='--')
-for i, (bar, val) in enumerate(zip(bars2, comp_list)):
-    height = bar.get_height()
-    ax.text(bar.get_x() + bar.get_width()/2., height,
-            f'{val:.2f}:1', ha='center', va='bottom', fontsize=12, fontweight='bold')
-
-# 3. Bits per Pixel vs Quality
-ax = axes[2]
-bpp_list = [bpp_values[q] for q in qualities]
-bars3 = ax.bar(range(len(qualities)), bpp_list, color=colors, alpha=0.8, edgecolor='black', linewidth=2)
-ax.set_xticks(range(len(qualities)))
-ax.set_xticklabels([f'Q={q}' for q in qualities], fontsize=14, fontweight='bold')
-ax.set_ylabel('比特率 (bpp)', fontsize=14, fontweight='bold')
-ax.set_title('品質 vs 比特率\n(越低越好)', fontsize=15, fontweight='bold')
-ax.grid(axis='y', alpha=0.3, linestyle='--')
-for i, (bar, val) in enumerate(zip(bars3, bpp_list)):
-    height = bar.get_height()
-    ax.text(bar.get_x() + bar.get_width()/2., height,
-            f'{val:.3f}', ha='center', va='bottom', fontsize=12, fontweight='bold')
-
-plt.tight_layout()
-plt.savefig('/workspace/MMIP_hw2/results_real/performance_comparison.png', dpi=300, bbox_inches='tight')
-print("✓ 已儲存: performance_comparison.png")
-
-# Rate-Distortion 曲線
-fig, ax = plt.subplots(figsize=(10, 6))
-
-psnr_list = [psnr_values[q] for q in qualities]
-compression_list = [compression_values[q] for q in qualities]
-
-# 繪製曲線
-ax.plot(compression_list, psnr_list, 'o-', linewidth=3, markersize=12, 
-        color='#2E86AB', markerfacecolor='#A23B72', markeredgewidth=2, markeredgecolor='#2E86AB')
-
-# 標記點
-for comp, psnr, q in zip(compression_list, psnr_list, qualities):
-    ax.annotate(f'Q={q}\n{psnr:.2f}dB\n{comp:.2f}:1', 
-                xy=(comp, psnr), xytext=(0, 15), textcoords='offset points',
-                ha='center', fontsize=12, fontweight='bold',
-                bbox=dict(boxstyle='round,pad=0.5', facecolor='yellow', alpha=0.3))
-
-ax.set_xlabel('壓縮率 (Original / Compressed) (:1)', fontsize=14, fontweight='bold')
-ax.set_ylabel('PSNR (dB)', fontsize=14, fontweight='bold')
-ax.set_title('Rate-Distortion 曲線\n(Medimodel Human_Skull_2 CT)', fontsize=16, fontweight='bold')
-ax.grid(True, alpha=0.3, linestyle='--')
-ax.set_xlim(14, 16)
-ax.set_ylim(48, 62)
-
-plt.tight_layout()
-plt.savefig('/workspace/MMIP_hw2/results_real/rate_distortion_curve.png', dpi=300, bbox_inches='tight')
-print("✓ 已儲存: rate_distortion_curve.png")
-
-# 每片結果詳細圖
-fig, axes = plt.subplots(2, 3, figsize=(16, 10))
-axes = axes.flatten()
-
-slices = ['I50', 'I100', 'I150', 'I200', 'I250']
-for idx, (result, ax) in enumerate(zip(data['results'], axes[:5])):
-    slice_name = result['slice'].replace('.dcm', '')
-    qualities_data = result['qualities']
+    Args:
+        metrics: collect_metrics 的輸出
+        
+    Returns:
+        (psnr_values, compression_values, bpp_values)，皆為 {quality: 平均值}
+    """
+    means = metrics.mean(axis=0)
+    return tuple(dict(zip(qualities, means[:, j].tolist())) for j in range(len(METRIC_KEYS)))
+
+BAR_COLORS = ['#FF6B6B', '#4ECDC4', '#45B7D1']
+
+def _plot_panel(ax, qualities, values, ylabel, title, fmt):
+    """
+    繪製單一「品質 vs 指標」長條圖，數值標籤以 bar_label 一次加上
     
-    qualities_list = [30, 60, 90]
-    psnr_list = [qualities_data[str(q)]['psnr_db'] for q in qualities_list]
+    Args:
+        ax: 目標 Axes
+        qualities: 品質等級列表（x 軸）
+        values: 對應的指標值
+        ylabel: y 軸標籤
+        title: 子圖標題
+        fmt: 數值標籤格式（例如 '{:.2f} dB'）
+    """
+    bars = ax.bar(range(len(qualities)), values, color=BAR_COLORS, alpha=0.8, edgecolor='black', linewidth=2)
+    ax.set_xticks(range(len(qualities)))
+    ax.set_xticklabels([f'Q={q}' for q in qualities], fontsize=14, fontweight='bold')
+    ax.set_ylabel(ylabel, fontsize=14, fontweight='bold')
+    ax.set_title(title, fontsize=15, fontweight='bold')
+    ax.grid(axis='y', alpha=0.3, linestyle='--')
+    ax.bar_label(bars, labels=[fmt.format(v) for v in values], fontsize=12, fontweight='bold')
+
+def plot_summary_figures(data):
+    """繪製效能比較、Rate-Distortion 曲線與各切片 PSNR 圖"""
+    qualities = QUALITIES
+    metrics = collect_metrics(data, qualities)
+    psnr_values, compression_values, bpp_values = average_metrics(metrics, qualities)
+
+    # 創建圖表
+    fig, axes = plt.subplots(1, 3, figsize=(15, 4), sharey=False)
+
+    _plot_panel(axes[0], qualities, [psnr_values[q] for q in qualities],
+                'PSNR (dB)', '品質 vs PSNR\n(越高越好)', '{:.2f} dB')
+    _plot_panel(axes[1], qualities, [compression_values[q] for q in qualities],
+                '壓縮率 (:1)', '品質 vs 壓縮率\n(越高越好)', '{:.2f}:1')
+    _plot_panel(axes[2], qualities, [bpp_values[q] for q in qualities],
+                '比特率 (bpp)', '品質 vs 比特率\n(越低越好)', '{:.3f}')
+
+    fig.tight_layout()
+    fig.savefig('/workspace/MMIP_hw2/results_real/performance_comparison.png', **SAVEFIG_OPTIONS)
+    plt.close(fig)  # 立即釋放 300 dpi 的 Agg 畫布
+    print("✓ 已儲存: performance_comparison.png")
+
+    # Rate-Distortion 曲線
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    psnr_list = [psnr_values[q] for q in qualities]
+    compression_list = [compression_values[q] for q in qualities]
+
+    # 繪製曲線
+    ax.plot(compression_list, psnr_list, 'o-', linewidth=3, markersize=12, 
+            color='#2E86AB', markerfacecolor='#A23B72', markeredgewidth=2, markeredgecolor='#2E86AB')
+
+    # 標記點
+    for comp, psnr, q in zip(compression_list, psnr_list, qualities):
+        ax.annotate(f'Q={q}\n{psnr:.2f}dB\n{comp:.2f}:1', 
+                    xy=(comp, psnr), xytext=(0, 15), textcoords='offset points',
+                    ha='center', fontsize=12, fontweight='bold',
+                    bbox=dict(boxstyle='round,pad=0.5', facecolor='yellow', alpha=0.3))
+
+    ax.set_xlabel('壓縮率 (Original / Compressed) (:1)', fontsize=14, fontweight='bold')
+    ax.set_ylabel('PSNR (dB)', fontsize=14, fontweight='bold')
+    ax.set_title('Rate-Distortion 曲線\n(Medimodel Human_Skull_2 CT)', fontsize=16, fontweight='bold')
+    ax.grid(True, alpha=0.3, linestyle='--')
+    ax.set_xlim(14, 16)
+    ax.set_ylim(48, 62)
+
+    fig.tight_layout()
+    fig.savefig('/workspace/MMIP_hw2/results_real/rate_distortion_curve.png', **SAVEFIG_OPTIONS)
+    plt.close(fig)
+    print("✓ 已儲存: rate_distortion_curve.png")
+
+    # 每片結果詳細圖
+    fig, axes = plt.subplots(2, 3, figsize=(16, 10))
+    axes = axes.flatten()
+
+    # 每片的 PSNR 與值範圍先整理成陣列，迴圈內只取列
+    psnr_matrix = metrics[:, :, METRIC_KEYS.index('psnr_db')]
+    value_ranges = np.array([result['value_range'] for result in data['results']], dtype=np.float64)
+    slice_names = [result['slice'].replace('.dcm', '') for result in data['results']]
+
+    for idx, ax in enumerate(axes[:min(5, len(slice_names))]):
+        psnr_list = psnr_matrix[idx].tolist()
+        vmin, vmax = value_ranges[idx]
     
-    bars = ax.bar(range(len(qualities_list)), psnr_list, 
-                  color=['#FF6B6B', '#4ECDC4', '#45B7D1'], 
-                  alpha=0.8, edgecolor='black', linewidth=2)
+        bars = ax.bar(range(len(qualities)), psnr_list, 
+                      color=BAR_COLORS, 
+                      alpha=0.8, edgecolor='black', linewidth=2)
     
-    ax.set_xticks(range(len(qualities_list)))
-    ax.set_xticklabels([f'Q={q}' for q in qualities_list], fontweight='bold', fontsize=11)
-    ax.set_ylabel('PSNR (dB)', fontweight='bold', fontsize=11)
-    ax.set_title(f'{slice_name} - 值範圍 {result["value_range"][0]:.0f}~{result["value_range"][1]:.0f}', 
-                 fontweight='bold', fontsize=12)
-    ax.set_ylim(40, 70)
-    ax.grid(axis='y', alpha=0.3, linestyle='--')
+        ax.set_xticks(range(len(qualities)))
+        ax.set_xticklabels([f'Q={q}' for q in qualities], fontweight='bold', fontsize=11)
+        ax.set_ylabel('PSNR (dB)', fontweight='bold', fontsize=11)
+        ax.set_title(f'{slice_names[idx]} - 值範圍 {vmin:.0f}~{vmax:.0f}', 
+                     fontweight='bold', fontsize=12)
+        ax.set_ylim(40, 70)
+        ax.grid(axis='y', alpha=0.3, linestyle='--')
     
-    for bar, val in zip(bars, psnr_list):
-        height = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width()/2., height,
-                f'{val:.1f}', ha='center', va='bottom', fontsize=11, fontweight='bold')
+        ax.bar_label(bars, labels=[f'{val:.1f}' for val in psnr_list], fontsize=11, fontweight='bold')
 
-# 移除多餘的子圖
-axes[5].remove()
+    # 移除多餘的子圖
+    axes[5].remove()
 
-plt.suptitle('各切片 PSNR 性能 (Medimodel Human_Skull_2 CT)', 
-             fontsize=16, fontweight='bold', y=1.00)
-plt.tight_layout()
-plt.savefig('/workspace/MMIP_hw2/results_real/slice_details.png', dpi=300, bbox_inches='tight')
-print("✓ 已儲存: slice_details.png")
+    fig.suptitle('各切片 PSNR 性能 (Medimodel Human_Skull_2 CT)', 
+                 fontsize=16, fontweight='bold', y=1.00)
+    fig.tight_layout()
+    fig.savefig('/workspace/MMIP_hw2/results_real/slice_details.png', **SAVEFIG_OPTIONS)
+    plt.close(fig)
+    print("✓ 已儲存: slice_details.png")
 
 # 生成定性重建與誤差圖
 def generate_qualitative_example():
@@ -182,15 +190,25 @@ def generate_qualitative_example():
     recon = decode_image_direct(bitstream)
 
     # 視覺化時做簡單視窗化，避免灰階範圍過寬
+    # 0.5 / 99.5 百分位一次 partition 取得；正規化在單一 float32 緩衝區內完成
     def window(img):
-        vmin, vmax = np.percentile(img, [0.5, 99.5])
-        return np.clip((img - vmin) / (vmax - vmin + 1e-6), 0, 1)
+        flat = img.ravel()
+        lo, hi = int(0.005 * (flat.size - 1)), int(0.995 * (flat.size - 1))
+        parted = np.partition(flat, [lo, hi])
+        vmin, vmax = float(parted[lo]), float(parted[hi])
+        out = np.subtract(img, vmin, dtype=np.float32)
+        out *= 1.0 / (vmax - vmin + 1e-6)
+        return np.clip(out, 0, 1, out=out)
 
     orig_vis = window(image)
     recon_vis = window(recon)
 
-    abs_err = np.abs(image - recon)
-    err_max = max(np.quantile(abs_err, 0.995), 1e-6)
+    # |原始-重建| 直接寫入同一個 float32 緩衝區；99.5 百分位以 partition 取得（O(n)，不必整體排序）
+    abs_err = np.empty(image.shape, dtype=np.float32)
+    np.subtract(image, recon, out=abs_err, casting='unsafe')
+    np.abs(abs_err, out=abs_err)
+    k = int(0.995 * (abs_err.size - 1))
+    err_max = max(float(np.partition(abs_err.ravel(), k)[k]), 1e-6)
 
     fig, axes = plt.subplots(1, 3, figsize=(15, 5))
 
@@ -208,14 +226,20 @@ def generate_qualitative_example():
     cbar = fig.colorbar(im2, ax=axes[2], fraction=0.046, pad=0.04)
     cbar.ax.set_ylabel('絕對差', fontsize=12, fontweight='bold')
 
-    plt.tight_layout()
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    fig.tight_layout()
+    fig.savefig(output_path, **SAVEFIG_OPTIONS)
+    plt.close(fig)
     print(f"✓ 已儲存: {output_path.name}")
 
-generate_qualitative_example()
+if __name__ == '__main__':
+    with open(RESULTS_FILE, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    plot_summary_figures(data)
+    generate_qualitative_example()
 
-print("\n圖表已全部生成！")
-print("  - performance_comparison.png")
-print("  - rate_distortion_curve.png")
-print("  - slice_details.png")
-print("  - qualitative_I150_Q60.png")
+    print("\n圖表已全部生成！")
+    print("  - performance_comparison.png")
+    print("  - rate_distortion_curve.png")
+    print("  - slice_details.png")
+    print("  - qualitative_I150_Q60.png")
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Shared WeasyPrint HTML → PDF rendering for the report generators
+Fonts are configured once per process, and a PDF is only re-rendered
+when its HTML input has changed since the last run (see pdf_stamp)
+"""
+
+import re
+
+from weasyprint import HTML
+from weasyprint.text.fonts import FontConfiguration
+
+from pdf_stamp import input_digest, is_up_to_date, write_stamp
+
+# One font configuration for every render (loading the CJK fonts is the
+# expensive part of a WeasyPrint run)
+FONT_CONFIG = FontConfiguration()
+
+def render_pdf(html, pdf_file, force=False):
+    """
+    Render an HTML string to PDF
+
+    The input digest covers the HTML and the size/mtime of every local
+    file:// resource it references (e.g. figures); rendering is skipped
+    if the PDF's stamp still matches it.
+
+    Returns: True if the PDF was written, False if it was up to date
+    """
+    resources = re.findall(r'file://([^"\'()\s]+)', html)
+    digest = input_digest(html, resources)
+
+    if not force and is_up_to_date(pdf_file, digest):
+        print(f"✓ PDF up to date, skipped rendering: {pdf_file}")
+        return False
+
+    HTML(string=html).write_pdf(pdf_file, font_config=FONT_CONFIG)
+    write_stamp(pdf_file, digest)
+    return True
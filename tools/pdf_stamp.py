@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Up-to-date stamps for generated PDFs
+A stamp (<pdf>.sha1) records the digest of the inputs a PDF was built
+from and the size/mtime of the PDF that was written; a build is skipped
+only if both still match, so a PDF rewritten by another tool (pandoc,
+WeasyPrint, headless Chrome, wkhtmltopdf) is always rebuilt
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+def file_signature(path):
+    """'size:mtime_ns' of a file, or 'missing'"""
+    if not os.path.exists(path):
+        return 'missing'
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def input_digest(text, resources=()):
+    """SHA-1 of the source text plus the path and signature of each local resource"""
+    digest = hashlib.sha1(text.encode('utf-8'))
+    for path in sorted(set(str(p) for p in resources)):
+        digest.update(f"{path}:{file_signature(path)}".encode('utf-8'))
+    return digest.hexdigest()
+
+def stamp_path(pdf_file):
+    pdf_file = Path(pdf_file)
+    return pdf_file.with_name(pdf_file.name + '.sha1')
+
+def is_up_to_date(pdf_file, digest):
+    """True if pdf_file was built from these inputs and not rewritten since"""
+    stamp_file = stamp_path(pdf_file)
+    return (stamp_file.exists()
+            and stamp_file.read_text().split() == [digest, file_signature(pdf_file)])
+
+def write_stamp(pdf_file, digest):
+    """Record that pdf_file was just built from inputs with this digest"""
+    stamp_path(pdf_file).write_text(f"{digest}\n{file_signature(pdf_file)}\n")
@@ -2,23 +2,31 @@
 """
 Test suite to verify codec functionality
 """
+import io
+import os
 import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
 from pathlib import Path
 import numpy as np
 
+def temp_name(stem, suffix):
+    """Unique scratch file name, so tests running concurrently never share files"""
+    return f'{stem}_{os.getpid()}_{uuid.uuid4().hex}{suffix}'
+
 def test_imports():
     """Test all required imports"""
     print("Testing imports...")
-    try:
-        import numpy
-        import scipy
-        import pydicom
-        import matplotlib
-        print("  ✓ All imports successful")
-        return True
-    except ImportError as e:
-        print(f"  ✗ Import failed: {e}")
+    # find_spec only locates the modules; the tests that need them import them
+    missing = [name for name in ('numpy', 'scipy', 'pydicom', 'matplotlib')
+               if find_spec(name) is None]
+    if missing:
+        print(f"  ✗ Import failed: missing {', '.join(missing)}")
         return False
+    print("  ✓ All imports successful")
+    return True
 
 def test_codec_roundtrip():
     """Test encode-decode roundtrip"""
@@ -38,11 +46,11 @@ def test_codec_roundtrip():
         original, metadata = read_dicom(input_file)
         
         # Encode
-        compressed = 'test_roundtrip.bin'
+        compressed = temp_name('test_roundtrip', '.bin')
         encode_image(input_file, compressed, quality=75)
         
         # Decode
-        reconstructed_file = 'test_roundtrip.raw'
+        reconstructed_file = temp_name('test_roundtrip', '.raw')
         decode_image(compressed, reconstructed_file)
         
         # Load reconstructed
@@ -86,7 +94,7 @@ def test_bitstream_validation():
                 return False
         
         # Test invalid file
-        invalid_file = 'test_invalid.bin'
+        invalid_file = temp_name('test_invalid', '.bin')
         Path(invalid_file).write_bytes(b'INVALID DATA')
         
         if not validate_bitstream(invalid_file):
@@ -102,24 +110,53 @@ def test_bitstream_validation():
         print(f"  ✗ Validation test failed: {e}")
         return False
 
+def test_truncated_bitstream():
+    """Test that a truncated bitstream is rejected instead of decoded"""
+    print("\nTesting truncated bitstream...")
+    try:
+        from encode import encode_array
+        from decode import decode_image
+        
+        rng = np.random.default_rng(0)
+        pixels = rng.integers(0, 4096, size=(64, 64), dtype=np.int32)
+        bitstream = encode_array(pixels, 12, quality=75)
+        
+        truncated_file = temp_name('test_truncated', '.bin')
+        output_file = temp_name('test_truncated', '.raw')
+        Path(truncated_file).write_bytes(bitstream[:len(bitstream) // 2])
+        try:
+            decode_image(truncated_file, output_file)
+        except SystemExit as e:
+            if e.code:
+                print(f"  ✓ Truncated bitstream rejected")
+                return True
+        finally:
+            Path(truncated_file).unlink()
+            Path(output_file).unlink(missing_ok=True)
+        
+        print(f"  ✗ Truncated bitstream decoded")
+        return False
+        
+    except Exception as e:
+        print(f"  ✗ Truncation test failed: {e}")
+        return False
+
 def test_quality_levels():
     """Test different quality levels"""
     print("\nTesting quality levels...")
     try:
-        from encode import encode_image
+        from encode import encode_array
+        from utils import read_dicom
         
         input_file = 'test_data/ct_256x256.dcm'
         if not Path(input_file).exists():
             print(f"  ✗ Test file not found")
             return False
         
-        sizes = []
-        for q in [10, 50, 90]:
-            output = f'test_q{q}.bin'
-            encode_image(input_file, output, quality=q, block_size=8)
-            size = Path(output).stat().st_size
-            sizes.append(size)
-            Path(output).unlink()
+        # Read the DICOM once and encode it in memory at each quality
+        pixels, metadata = read_dicom(input_file)
+        sizes = [len(encode_array(pixels, metadata['bit_depth'], quality=q, block_size=8))
+                 for q in [10, 50, 90]]
         
         # Higher quality should generally mean larger files
         # (not always true due to Huffman, but usually)
@@ -148,10 +185,9 @@ def test_file_structure():
         'REPORT.md'
     ]
     
-    missing = []
-    for file in required_files:
-        if not Path(file).exists():
-            missing.append(file)
+    # One directory listing instead of a stat() per file
+    present = {entry.name for entry in os.scandir('.')}
+    missing = [file for file in required_files if file not in present]
     
     if missing:
         print(f"  ✗ Missing files: {missing}")
@@ -160,8 +196,49 @@ def test_file_structure():
         print(f"  ✓ All required files present ({len(required_files)} files)")
         return True
 
-def main():
-    """Run all tests"""
+class ThreadOutput:
+    """
+    sys.stdout/sys.stderr replacement that collects each worker thread's
+    output in that thread's buffer (shared by both streams, so a test's
+    tracebacks stay in place), so concurrent tests don't interleave
+    """
+    def __init__(self, stream, local):
+        self.stream = stream
+        self.local = local
+
+    def write(self, text):
+        return getattr(self.local, 'buffer', self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+def run_test(test, local=None):
+    """
+    Run one test, treating a crash as a failure
+    
+    Args:
+        test: Test function
+        local: threading.local whose buffer ThreadOutput writes to
+               (None: print directly)
+    
+    Returns:
+        (result, captured output or '')
+    """
+    if local is not None:
+        local.buffer = io.StringIO()
+    try:
+        result = test()
+    except Exception as e:
+        print(f"\n✗ Test crashed: {e}")
+        result = False
+    if local is None:
+        return result, ''
+    text = local.buffer.getvalue()
+    del local.buffer
+    return result, text
+
+def main(serial=False):
+    """Run all tests (concurrently unless serial=True)"""
     print("="*60)
     print("Medical Image Codec - Test Suite")
     print("="*60)
@@ -171,17 +248,27 @@ def main():
         test_imports,
         test_codec_roundtrip,
         test_bitstream_validation,
+        test_truncated_bitstream,
         test_quality_levels
     ]
     
-    results = []
-    for test in tests:
+    if serial:
+        results = [run_test(test)[0] for test in tests]
+    else:
+        # Tests are independent (unique scratch files); report them in order
+        local = threading.local()
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = ThreadOutput(stdout, local)
+        sys.stderr = ThreadOutput(stderr, local)
         try:
-            result = test()
+            with ThreadPoolExecutor(max_workers=len(tests)) as executor:
+                outcomes = list(executor.map(lambda test: run_test(test, local), tests))
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+        results = []
+        for result, text in outcomes:
+            sys.stdout.write(text)
             results.append(result)
-        except Exception as e:
-            print(f"\n✗ Test crashed: {e}")
-            results.append(False)
     
     print("\n" + "="*60)
     print(f"Test Results: {sum(results)}/{len(results)} passed")
@@ -195,4 +282,4 @@ def main():
         return 1
 
 if __name__ == '__main__':
-    sys.exit(main())
+    sys.exit(main(serial='--serial' in sys.argv[1:]))